@@ -1,13 +1,14 @@
 import argparse
+import io
 import logging
 import xml.etree.ElementTree as ET
-import importlib
 import os
 
 from xml.dom import minidom
 from copy import copy, deepcopy
 from io import TextIOWrapper
 from pathlib import Path
+from sys import intern
 # from itertools import pairwise
 from typing import OrderedDict,  cast
 from pprint import pprint
@@ -15,6 +16,7 @@ from pprint import pprint
 from Operations import (
     NO_NODE,
     NO_VALUE,
+    UNUSED_TAG,
     Interval,
     ReadOnly,
     ReadOnlyEnd,
@@ -37,13 +39,20 @@ from Operations import (
     Reply,
 )
 
+from TraceWriter import InstanceTemplate, TraceWriter
+import LogParser
+import LogCache
+import LogIndex
+import IdealParsers
+import Properties
+from Timestamps import INITIAL_TIME, TimestampTable, boundary_names, format_timestamp
+
 
 # TODO:
 # Starting Ending 
 # Read Initial members from log
 
 
-UNUSED_TAG = -1
 # NO_REPLIER = "NoReplier"
 # NO_VALUE = "NoValue"
 # NO_REPONSIBLE = "NoResponsible"
@@ -141,7 +150,8 @@ def create_instance(
     nodes: set[str],
     keys: set[str],
     values: set[str],
-    times: set[str],
+    times: set[int],
+    boundaries: dict[int, str],
     operations: dict[str, Operation],
     stable_regimens: dict[str, Stable | StableEnd],
     readonly_regimens: dict[str, ReadOnly | ReadOnlyEnd],
@@ -209,8 +219,7 @@ def create_instance(
 
     # Boundary
     boundary_sig = add_element(instance, "sig", "ATL/Boundary", BOUNDARY_ID, UNIV_ID)
-    # for boundary in times.values():
-    for boundary in times:
+    for boundary in boundaries.values():
         add_element(boundary_sig, "atom", boundary)
 
     # Member
@@ -313,37 +322,37 @@ def create_instance(
     # ReadOnly Intervals:
     for read_only in readonly_regimens.values():
         add_element(read_only_sig, "atom", read_only.get_name())
-        add_tuple(interval_start, read_only.get_name(), read_only.get_time())
+        add_tuple(interval_start, read_only.get_name(), boundaries[read_only.get_time()])
         end_time = read_only.get_end_time()
-        if end_time:
-            add_tuple(interval_end, read_only.get_name(), end_time)
+        if end_time is not None:
+            add_tuple(interval_end, read_only.get_name(), boundaries[end_time])
 
     # Stable Intervals:
     for stable in stable_regimens.values():
         add_element(stable_sig, "atom", stable.get_name())
-        add_tuple(interval_start, stable.get_name(), stable.get_time())
+        add_tuple(interval_start, stable.get_name(), boundaries[stable.get_time()])
         end_time = stable.get_end_time()
-        if end_time:
-            add_tuple(interval_end, stable.get_name(), end_time)
+        if end_time is not None:
+            add_tuple(interval_end, stable.get_name(), boundaries[end_time])
 
     # Member Intervals:
     for member in members.values():
         add_element(member_sig, "atom", member.get_name())
         add_tuple(member_node, member.get_name(), member.get_node())
 
-        add_tuple(interval_start, member.get_name(), member.get_time())
+        add_tuple(interval_start, member.get_name(), boundaries[member.get_time()])
         end_time = member.get_end_time()
-        if end_time:
-            add_tuple(interval_end, member.get_name(), end_time)
+        if end_time is not None:
+            add_tuple(interval_end, member.get_name(), boundaries[end_time])
 
 
     # Ideal Intervals:
     for ideal in ideal_states.values():
         add_element(ideal_sig, "atom", ideal.get_name())
-        add_tuple(interval_start, ideal.get_name(), ideal.get_time())
+        add_tuple(interval_start, ideal.get_name(), boundaries[ideal.get_time()])
         end_time = ideal.get_end_time()
-        if end_time:
-            add_tuple(interval_end, ideal.get_name(), end_time)
+        if end_time is not None:
+            add_tuple(interval_end, ideal.get_name(), boundaries[end_time])
 
     for responsible in responsible_intervals.values():
         add_element(responsible_sig, "atom", responsible.get_name())
@@ -352,10 +361,10 @@ def create_instance(
         for r_key in responsible.get_keys():
             add_tuple(responsible_key, responsible.get_name(), r_key)
 
-        add_tuple(interval_start, responsible.get_name(), responsible.get_time())
+        add_tuple(interval_start, responsible.get_name(), boundaries[responsible.get_time()])
         end_time = responsible.get_end_time()
-        if end_time:
-            add_tuple(interval_end, responsible.get_name(), end_time)
+        if end_time is not None:
+            add_tuple(interval_end, responsible.get_name(), boundaries[end_time])
 
     for op in operations.values():
         if isinstance(op, FunctionalOperation):
@@ -363,10 +372,10 @@ def create_instance(
             add_tuple(functional_operation_key, op.get_name(), op.get_key())
             add_tuple(functional_operation_replier, op.get_name(), op.get_replier())
 
-            add_tuple(interval_start, op.get_name(), op.get_time())
+            add_tuple(interval_start, op.get_name(), boundaries[op.get_time()])
             end_time = op.get_end_time()
-            if end_time:
-                add_tuple(interval_end, op.get_name(), end_time)
+            if end_time is not None:
+                add_tuple(interval_end, op.get_name(), boundaries[end_time])
 
             if op.get_type() in ("Store", "Remove"):
                     op = cast(Store, op)
@@ -388,11 +397,11 @@ def create_instance(
         elif op.get_type() in ("Join", "Leave", "Fail"):
             add_tuple(membership_op_node, op.get_name(), op.get_node())
 
-            add_tuple(interval_start, op.get_name(), op.get_time())
+            add_tuple(interval_start, op.get_name(), boundaries[op.get_time()])
 
             end_time = op.get_end_time()
-            if end_time:
-                add_tuple(interval_end, op.get_name(), end_time)
+            if end_time is not None:
+                add_tuple(interval_end, op.get_name(), boundaries[end_time])
 
             if op.get_type() == "Join":
                     add_element(join_sig, "atom", op.get_name())
@@ -462,13 +471,14 @@ def id_node(node: str):
 # 2022-09-27 18:00:00.000, ReplyJoin, <ID>
 
 
-def read_log(log: TextIOWrapper, starting_line, line_count) -> tuple[str | None, set[str], set[str], set[str], set[str], OrderedDict[str, Operation]]:
+def read_log(log: TextIOWrapper, starting_line, line_count) -> tuple[int | None, set[str], set[str], set[str], set[int], OrderedDict[str, Operation]]:
     nodes = set()
     keys = set()
     values = set()
     values = {NO_VALUE}
 
     times = set()
+    timestamps = TimestampTable()
 
     operations = OrderedDict()
     op_counts = dict()
@@ -487,12 +497,14 @@ def read_log(log: TextIOWrapper, starting_line, line_count) -> tuple[str | None,
             break
         line_counter += 1
 
-        components = list(map(lambda x: x.strip(","), line.strip().split(", ")))
+        # Nodes, keys, values and timestamps repeat across lines, share a single string for each
+        components = list(map(lambda x: intern(x.strip(",")), line.strip().split(", ")))
 
 
         # logging.debug(f"line {line_count} {components}")
 
         time, optype = components[0:2]
+        time = timestamps[time]
         times.add(time)
 
         if line_counter >= starting_line and initial_time is None:
@@ -629,9 +641,19 @@ def read_log(log: TextIOWrapper, starting_line, line_count) -> tuple[str | None,
 
 
 
+def write_time_table(path: Path, boundaries: dict[int, str]):
+    """Writes one line with the Boundary atom and its log timestamp for each time of the trace."""
+    with open(path, "w") as f:
+        for (time, boundary) in boundaries.items():
+            f.write(f"{boundary}, {format_timestamp(time)}\n")
+
+    logging.info(f"Time table written to {path}")
+
+
 def complete_trace(
-    root: ET.Element, 
-    instance_template: ET.Element,
+    writer: TraceWriter,
+    instance_template: InstanceTemplate,
+    boundaries: dict[int, str],
     operations: dict[str, Operation],
     stable_regimens: dict[str, Stable | StableEnd],
     readonly_regimens: dict[str, ReadOnly | ReadOnlyEnd],
@@ -639,14 +661,15 @@ def complete_trace(
     ideal_states: OrderedDict[str, IdealStart | IdealEnd],
     responsibility_intervals: dict[str, ResponsibleStart | ResponsibleEnd]
 ):
-    ongoing = set()
+    # Ongoing events, in insertion order, and their serialized atoms
+    ongoing : dict[Interval | Operation, bytes] = {}
     prev = None
-    instance = None
 
-    ongoing_sig = None
-    # starting_sig = None
-    # ending_sig = None
-    happens_sig = None
+    # Serialized atoms of the events ongoing at the start of the current state.
+    # Each state only applies its start/end deltas to it instead of rebuilding it.
+    ongoing_atoms = b""
+    started = None
+    ended = False
 
 
     events = operations | stable_regimens | readonly_regimens | members | ideal_states | responsibility_intervals
@@ -664,40 +687,23 @@ def complete_trace(
         # logging.debug(f"Ongoing: {ongoing}")
 
         if event.get_time() != prev:
-            if instance is not None:
-                root.append(instance)
-
-            logging.debug(f"New instance at {event.get_time()}")
-            instance = deepcopy(instance_template)
-
-            ongoing_sig = instance.find("sig[@label='ATL/Ongoing']")
-            # starting_sig = instance.find("sig[@label='ATL/Starting']")
-            # ending_sig = instance.find("sig[@label='ATL/Ending']")
+            if started is not None:
+                writer.append(instance_template.instance((boundaries[prev],), ongoing_atoms, *started))
 
-            happens_sig = instance.find("sig[@label='ATL/Happens']")
+                if ended:
+                    ongoing_atoms = b"".join(ongoing.values())
+                elif started:
+                    ongoing_atoms = b"".join((ongoing_atoms, *started))
 
-            assert ongoing_sig is not None, "Ongoing sig not found"
-            assert happens_sig is not None, "Happens sig not found"
-
-
-            add_element(happens_sig, "atom", event.get_time())
+            logging.debug(f"New instance at {event.get_time()}")
 
-            for e in ongoing:
-                add_element(ongoing_sig, "atom", e.get_name())
+            started = []
+            ended = False
             prev = event.get_time()
 
-        else:
-            assert instance is not None, "Instance not created"
-
-        assert ongoing_sig is not None, "Ongoing sig not found"
-        # assert starting_sig is not None, "Starting sig not found"
-        # assert ending_sig is not None, "Ending sig not found"
-
-        assert happens_sig is not None, "Happens sig not found"
+        assert started is not None, "Instance not created"
 
         if event.is_end():
-            # add_element(ending_sig, "atom", events[event.get_id()].get_name())
-
             assert (
                 event.get_id() in events
             ), f"id of event {event} not in events"
@@ -706,32 +712,23 @@ def complete_trace(
                 events[event.get_id()] in ongoing
             ), f"event {event} not in ongoing"
             
-            ongoing.remove(events[event.get_id()])
+            del ongoing[events[event.get_id()]]
+            ended = True
         else:
-            # add_element(starting_sig, "atom", event.get_name())
-
-
-            add_element(ongoing_sig, "atom", event.get_name())
-
             assert event not in ongoing, f"event {event} already in ongoing"
-            ongoing.add(event)
-
-
 
-    if instance is not None:
-        root.append(instance)
+            atom = instance_template.atom(event.get_name())
+            ongoing[event] = atom
+            started.append(atom)
 
-    logging.debug("Creating backloop instance")
 
-    instance = deepcopy(instance_template)
 
-    ongoing_sig = instance.find("sig[@label='ATL/Ongoing']")
+    if started is not None:
+        writer.append(instance_template.instance((boundaries[prev],), ongoing_atoms, *started))
 
-    assert ongoing_sig is not None, "Ongoing sig not found"
+    logging.debug("Creating backloop instance")
 
-    for e in ongoing:
-        add_element(ongoing_sig, "atom", e.get_name())
-    root.append(instance)
+    writer.append(instance_template.instance((), *ongoing.values()))
 
 
 def detect_regimens(operations: OrderedDict[str, Operation]) -> tuple[dict, dict]:
@@ -867,14 +864,14 @@ def infer_member_interval (op: Operation, operations : dict[str, Operation], mem
 
 # remove operations that start before starting_line
 def remove_initial_intervals(
-    starting_time : str | None,
+    starting_time : int | None,
     operations: dict[str, Operation],
     stable_regimens: dict[str, Stable | StableEnd],
     read_only_regimens: dict[str, ReadOnly | ReadOnlyEnd],
     members: OrderedDict[str, MemberStart| MemberEnd],
     ideal_states: OrderedDict[str, IdealStart | IdealEnd],
     responsibility_intervals: dict[str, ResponsibleStart | ResponsibleEnd],
-    times : set[str]
+    times : set[int]
 ):
     if starting_time is None:
         return
@@ -898,7 +895,8 @@ def remove_initial_intervals(
             #     member.set_time(starting_time)
             # member.set_time(starting_time)
 
-            member.set_time("0")
+            member.set_time(INITIAL_TIME)
+            times.add(INITIAL_TIME)
 
         else:
             del members[key]
@@ -953,7 +951,8 @@ def remove_initial_intervals(
                 # assert false
             # op.set_time(starting_time)
 
-            op.set_time("0")
+            op.set_time(INITIAL_TIME)
+            times.add(INITIAL_TIME)
 
         else:
 
@@ -971,18 +970,19 @@ def remove_initial_intervals(
             # print(f"Adding initial store for {key} {value}")
             id = f"initial_Store_{counter}"
             # store = Store(starting_time, "Store",  id, counter, initial_member, key, value)
-            store = Store("0", "Store",  id, counter, initial_member, key, value)
+            store = Store(INITIAL_TIME, "Store",  id, counter, initial_member, key, value)
 
 
             # store.set_end_time(starting_time)
-            store.set_end_time("0")
+            store.set_end_time(INITIAL_TIME)
             store.set_replier(initial_member)
             operations[store.get_id()] = store
 
-            reply = Reply("0", "Store", id, UNUSED_TAG, initial_member)
+            reply = Reply(INITIAL_TIME, "Store", id, UNUSED_TAG, initial_member)
             # reply = Reply(starting_time, "Store", id, UNUSED_TAG, initial_member)
             operations["Reply-" + id] = reply
-            reply.set_end_time("0")
+            reply.set_end_time(INITIAL_TIME)
+            times.add(INITIAL_TIME)
 
 
 
@@ -995,10 +995,6 @@ def filter_operations(operations: OrderedDict[str, Operation], types: set[str])
 
     return operations
 
-def get_ideal_responsible(ideal_log: Path, limit_time: str, keys: set[str], operations: OrderedDict[str, Operation], member_intervals: OrderedDict[str, MemberStart| MemberEnd]) -> tuple[dict, dict]:
-
-    raise NotImplementedError("Ideal state detection not implemented")
-
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -1006,7 +1002,19 @@ def main():
     )
 
     parser.add_argument(
-        "-o", required=True, dest='output', type=Path, help="Path to save the generated XML file."
+        "-o", dest='output', type=Path, default=None, help="Path to save the generated XML file."
+    )
+
+    parser.add_argument(
+        "-e", "--evaluate", action="store_true", help="Check the DHT properties the trace flags allow in-process, as Evaluator.java does on the XML trace."
+    )
+
+    parser.add_argument(
+        "--counterexamples", type=int, default=10, help="Number of counterexamples printed for each property that does not hold."
+    )
+
+    parser.add_argument(
+        "--evaluate-jobs", type=int, default=1, help="Number of processes evaluating the properties of disjoint sets of keys in parallel with --evaluate."
     )
 
     parser.add_argument(
@@ -1015,7 +1023,7 @@ def main():
 
 
     parser.add_argument(
-        "-p", "-ip", required=True, dest='ideal_parser', type=Path, help="Path to the python file which can parse the ideal state information"
+        "-p", "-ip", dest='ideal_parser', type=str, default="chord", help="Ideal state parser: the name of a registered parser, the path to a python file defining one or an entry point name. Defaults to chord."
     )
 
     parser.add_argument(
@@ -1027,10 +1035,42 @@ def main():
         "--starting-line", type=int, default=0, help="Starting line number to process."
     )
 
+    parser.add_argument(
+        "--from-time", type=str, default=None, help="Timestamp of the first line to process, instead of --starting-line."
+    )
+
+    parser.add_argument(
+        "--to-time", type=str, default=None, help="Timestamp of the last line to process, instead of --line-count."
+    )
+
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Enable verbose logging."
     )
 
+    parser.add_argument(
+        "--columnar", action="store_true", help="Parse the log in blocks into columnar arrays before building the operations."
+    )
+
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="Number of processes parsing the log in parallel, implies --columnar."
+    )
+
+    parser.add_argument(
+        "--cache", action="store_true", help="Load the parsed log from a cache file next to it, creating it if missing or outdated. Implies --columnar."
+    )
+
+    parser.add_argument(
+        "--index", action="store_true", help="Seek to the starting line through an index file next to the log, creating it if missing or outdated. Implies --columnar."
+    )
+
+    parser.add_argument(
+        "--stream", action="store_true", help="Write each trace instance to the output file as soon as it is generated."
+    )
+
+    parser.add_argument(
+        "--time-table", type=Path, default=None, help="Write the log timestamp of each Boundary atom of the trace to this file."
+    )
+
     parser.add_argument(
         "-store", action="store_true", help="Add store operation information to the trace."
     )
@@ -1070,6 +1110,21 @@ def main():
 
     args = parser.parse_args()
 
+    if args.output is None and not args.evaluate:
+        parser.error("-o is required unless evaluating the properties with --evaluate")
+
+    flag_list =  [args.all, args.store, args.lookup, args.find, args.membership, args.read_only, args.stable, args.ideal, args.responsible]
+    args.all = args.all or not any(flag_list)
+
+    args.store = args.all or args.store
+    args.lookup = args.all or args.lookup
+    args.find = args.all or args.find
+    args.membership = args.all or args.membership
+    args.read_only = args.all or args.read_only
+    args.stable = args.all or args.stable
+    args.ideal = args.all or args.ideal
+    args.responsible = args.all or args.responsible
+
     logging.basicConfig(
         level=logging.DEBUG if args.verbose else logging.INFO,
         format="%(asctime)s - %(levelname)s - %(message)s"
@@ -1077,18 +1132,70 @@ def main():
         # filemode="a",
     )
 
+    # Resolved before parsing the log, so a wrong -p does not wait for it
+    ideal_parser = None
+    if args.ideal or args.responsible:
+        try:
+            ideal_parser = IdealParsers.load_ideal_parser(args.ideal_parser)
+        except (ValueError, ImportError) as e:
+            parser.error(str(e))
+
 
     model_file = os.getenv("ATL_MODEL")
-    if model_file is None:
+    if model_file is None and args.output is not None:
         print("ATL_MODEL environment variable not set.")
         print("Please set the ATL_MODEL environment variable to the path of the Alloy model file.")
         exit()
 
+    index = LogIndex.load_index(args.log) if args.index else None
 
-    model_file = os.path.abspath(model_file)
+    if args.from_time is not None or args.to_time is not None:
+        if args.starting_line != 0 or args.line_count != float("inf"):
+            parser.error("--from-time and --to-time cannot be combined with --starting-line and --line-count")
+
+        (first_line, end_line) = LogIndex.time_window(args.log, index, args.from_time, args.to_time)
+        if first_line >= end_line:
+            print(f"No lines of {args.log} between {args.from_time} and {args.to_time}.")
+            exit()
+
+        # read_log counts the starting line from one
+        args.starting_line = first_line + 1
+        args.line_count = end_line - args.starting_line
+
+        logging.info(f"Processing lines {first_line} to {end_line} of {args.log}")
+
+    if index is not None:
+        initial_time, nodes, keys, values, times, operations = LogIndex.read_window(args.log, index, args.starting_line, args.line_count)
+
+    elif args.columnar or args.jobs > 1 or args.cache or args.index:
+        columns = LogCache.load_columns(args.log) if args.cache else None
 
-    with args.log.open("r", encoding="utf-8") as log:
-        initial_time, nodes, keys, values, times, operations = read_log(log, args.starting_line,  args.line_count)
+        # Taken before parsing, so neither the cache nor the index is stamped valid for lines appended meanwhile
+        stamp = LogCache.log_stamp(args.log) if (args.cache and columns is None) or args.index else None
+
+        if columns is None:
+            # The cache and the index need every line of the log, so they serve any window
+            max_lines = float("inf") if args.cache or args.index else args.starting_line + args.line_count
+
+            if args.jobs > 1:
+                columns = LogParser.read_columns_parallel(args.log, args.jobs, max_lines)
+            else:
+                with args.log.open("r", encoding="utf-8") as log:
+                    columns = LogParser.read_columns(log, max_lines)
+
+            if args.cache:
+                LogCache.save_columns(args.log, columns, stamp)
+
+        if args.index:
+            log_index = LogIndex.build_index(args.log, columns)
+            if log_index is not None:
+                LogIndex.save_index(args.log, log_index, stamp)
+
+        initial_time, nodes, keys, values, times, operations = LogParser.build_operations(columns, args.starting_line, args.line_count)
+
+    else:
+        with args.log.open("r", encoding="utf-8") as log:
+            initial_time, nodes, keys, values, times, operations = read_log(log, args.starting_line,  args.line_count)
 
 
     logging.info(f" {len(nodes)} Nodes")
@@ -1097,18 +1204,6 @@ def main():
     logging.info(f" {len(operations)} operations and replies recorded")
     logging.info(f" {len(times)} operation timestamps")
 
-    flag_list =  [args.all, args.store, args.lookup, args.find, args.membership, args.read_only, args.stable, args.ideal, args.responsible]
-    args.all = args.all or not any(flag_list)
-
-    args.store = args.all or args.store
-    args.lookup = args.all or args.lookup
-    args.find = args.all or args.find
-    args.membership = args.all or args.membership
-    args.read_only = args.all or args.read_only
-    args.stable = args.all or args.stable
-    args.ideal = args.all or args.ideal
-    args.responsible = args.all or args.responsible
-
     operation_filter = {"Lookup", "ReplyLookup", "Store", "ReplyStore", "FindNode", "ReplyFindNode", "Join", "ReplyJoin", "Leave", "ReplyLeave", "Fail"}
 
 
@@ -1169,14 +1264,9 @@ def main():
     responsibility = {}
 
     if args.ideal or args.responsible:
-        module = importlib.import_module(args.ideal_parser.stem)
-
-        ideal_function = getattr(module, get_ideal_responsible.__name__)
-        assert ideal_function is not None, f"Function {ideal_function.__name__} not found in {args.ideal_parser.stem}"
-
         limit_time = max(times)
 
-        (ideal_states, responsibility) = ideal_function(args.ideal_log, limit_time, keys, operations, members)
+        (ideal_states, responsibility) = IdealParsers.parse_ideal(ideal_parser, args.ideal_log, limit_time, keys, IdealParsers.event_stream(operations, members))
 
         if not args.ideal:
             ideal_states = OrderedDict()
@@ -1215,13 +1305,13 @@ def main():
 
     for regimen in stable.values():
         times.add(regimen.get_time())
-        if regimen.get_end_time():
+        if regimen.get_end_time() is not None:
             times.add(regimen.get_end_time())
 
 
     for regimen in readonly.values():
         times.add(regimen.get_time())
-        if regimen.get_end_time():
+        if regimen.get_end_time() is not None:
             times.add(regimen.get_end_time())
 
     for member in members.values():
@@ -1246,26 +1336,65 @@ def main():
 
     logging.info(f"Total timestamps: {len(times)}")
 
+    boundaries = boundary_names(times)
 
-    root = create_root()
-    instance_template = create_instance(model_file, nodes, keys, values, times, operations, stable, readonly, members, ideal_states, responsibility)
-
-    complete_trace(root, instance_template, operations, stable, readonly, members, ideal_states, responsibility)
-    
-    logging.info(f"Writing XML trace to {args.output}")
-    tree = ET.ElementTree(root)
-
-    # Comment active flags in xml
     flag_names = ["all", "store", "lookup", "find", "membership", "read_only", "stable", "ideal", "responsible"]
     flag_list = [args.all, args.store, args.lookup, args.find, args.membership, args.read_only, args.stable, args.ideal, args.responsible]
 
+    if args.time_table:
+        write_time_table(args.time_table, boundaries)
+
+    if args.evaluate:
+        logging.info("Evaluating properties")
+        trace = Properties.Trace(nodes, operations, stable, readonly, members, ideal_states, responsibility)
+
+        flags = {name for (name, value) in zip(flag_names, flag_list) if value}
+        names = Properties.select_properties(flags)
+
+        if args.evaluate_jobs > 1:
+            results = Properties.evaluate_sharded(trace, names, args.evaluate_jobs)
+        else:
+            results = Properties.evaluate(trace, names)
+
+        Properties.report(results, args.counterexamples)
+
+    if args.output is None:
+        return
+
+    model_file = os.path.abspath(model_file)
+
+    root = create_root()
+    instance_template = create_instance(model_file, nodes, keys, values, times, boundaries, operations, stable, readonly, members, ideal_states, responsibility)
+
+    # Comment active flags in xml
     active_flags = [name for name, value in zip(flag_names, flag_list) if value]
     comment_text = f"Active flags: {', '.join(active_flags) }"
     comment_bytes = f'<!-- {comment_text} -->\n'.encode('utf-8')
 
+    trace_template = InstanceTemplate(instance_template)
+
+    if args.stream:
+        logging.info(f"Streaming XML trace to {args.output}")
+
+        with open(args.output, 'wb') as f:
+            f.write(comment_bytes)
+            writer = TraceWriter(f, root)
+            complete_trace(writer, trace_template, boundaries, operations, stable, readonly, members, ideal_states, responsibility)
+            writer.close()
+            logging.info(f"XML trace successfully written to {args.output}")
+
+        return
+
+    buffer = io.BytesIO()
+    writer = TraceWriter(buffer, root)
+    complete_trace(writer, trace_template, boundaries, operations, stable, readonly, members, ideal_states, responsibility)
+    writer.close()
+    
+    logging.info(f"Writing XML trace to {args.output}")
+
     with open(args.output, 'wb') as f:
         f.write(comment_bytes)
-        tree.write(f, encoding="utf-8", xml_declaration=False)
+        f.write(buffer.getbuffer())
         logging.info(f"XML trace successfully written to {args.output}")
 
     # xml_str = ET.tostring(root, encoding="unicode")
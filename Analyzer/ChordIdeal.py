@@ -1,6 +1,8 @@
 import bisect 
 
 # from pprint import pprint
+from collections import deque
+from collections.abc import Set
 from typing import OrderedDict
 from pathlib import Path
 
@@ -13,6 +15,8 @@ from Operations import (
     ResponsibleEnd,
     ResponsibleStart
 )
+from IdealParsers import IdealParser, event_stream, parse_ideal, register
+from Timestamps import TimestampTable
 
 
 # 2024-11-12 19:56:48.781, Successor, 0C0C45F4, null
@@ -43,249 +47,459 @@ def between(a: str, b: str, c: str) -> bool:
 
     return a < b or b <= c
 
-def is_ideal(pointers: dict[str, Pointer], current_members: list[str]) -> bool:
+class SortedRing:
+    """
+    Sorted set of nodes in circular order.
 
-    for i in range(0, len(current_members)):
+    The nodes are kept in sorted sublists of bounded size, so adding or
+    removing one only shifts its sublist, and each node is linked to the next
+    and previous nodes of the ring.
+    """
 
+    LOAD = 512
 
-        assert current_members[i] in pointers, f"Node {current_members[i]} not in pointers, pointers:\n{pointers}"
-        # if current_members[i] not in pointers:
-        #     # pointers[current_members[i]] = Pointer(current_members[i], None)
-        #     return False
+    def __init__(self):
+        self.sublists : list[list[str]] = []
+        self.maxes : list[str] = []
+        self.next : dict[str, str] = {}
+        self.prev : dict[str, str] = {}
 
-        is_not_successor = pointers[current_members[i]].succ != current_members[(i + 1) % len(current_members)]
-        is_not_only_node = len(current_members) != 1 or pointers[current_members[i]].succ is not None
+    def __len__(self):
+        return len(self.next)
 
-        if (is_not_successor and is_not_only_node):
+    def __contains__(self, node: str) -> bool:
+        return node in self.next
+
+    def __iter__(self):
+        for sublist in self.sublists:
+            yield from sublist
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def successor(self, node: str) -> str:
+        return self.next[node]
+
+    def predecessor(self, node: str) -> str:
+        return self.prev[node]
+
+    def add(self, node: str):
+        assert node not in self.next, f"Node {node} is already in the ring"
+
+        if not self.sublists:
+            self.sublists.append([node])
+            self.maxes.append(node)
+            self.next[node] = self.prev[node] = node
+            return
+
+        i = min(bisect.bisect_left(self.maxes, node), len(self.maxes) - 1)
+        sublist = self.sublists[i]
+        j = bisect.bisect_left(sublist, node)
+
+        if j < len(sublist):
+            succ = sublist[j]
+        else:
+            succ = self.sublists[(i + 1) % len(self.sublists)][0]
+
+        pred = self.prev[succ]
+        self.next[pred] = self.prev[succ] = node
+        self.next[node] = succ
+        self.prev[node] = pred
+
+        sublist.insert(j, node)
+        self.maxes[i] = sublist[-1]
+
+        if len(sublist) > 2 * self.LOAD:
+            self.sublists.insert(i + 1, sublist[self.LOAD:])
+            del sublist[self.LOAD:]
+            self.maxes.insert(i, sublist[-1])
+
+    def remove(self, node: str):
+        assert node in self.next, f"Node {node} is not in the ring"
+
+        i = bisect.bisect_left(self.maxes, node)
+        sublist = self.sublists[i]
+        del sublist[bisect.bisect_left(sublist, node)]
+
+        if sublist:
+            self.maxes[i] = sublist[-1]
+        else:
+            del self.sublists[i]
+            del self.maxes[i]
+
+        succ = self.next.pop(node)
+        pred = self.prev.pop(node)
+
+        if succ != node:
+            self.next[pred] = succ
+            self.prev[succ] = pred
+
+
+class KeyArc(Set):
+    """
+    Keys of a responsibility interval, the length keys of the sorted keys
+    starting at first and wrapping around, without copying them.
+    """
+
+    __slots__ = ("sorted_keys", "first", "length")
+
+    def __init__(self, sorted_keys: list[str], first: int, length: int):
+        self.sorted_keys = sorted_keys
+        self.first = first
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        last = self.first + self.length
+
+        yield from self.sorted_keys[self.first:last]
+
+        if last > len(self.sorted_keys):
+            yield from self.sorted_keys[:last - len(self.sorted_keys)]
+
+    def __contains__(self, key) -> bool:
+        pos = bisect.bisect_left(self.sorted_keys, key)
+
+        if pos == len(self.sorted_keys) or self.sorted_keys[pos] != key:
             return False
 
-    return True
+        return (pos - self.first) % len(self.sorted_keys) < self.length
+
+    def __eq__(self, other):
+        if isinstance(other, KeyArc) and other.sorted_keys is self.sorted_keys:
+            return (self.first, self.length) == (other.first, other.length)
+
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"KeyArc({set(self)})"
+
+
+class RingConsistency:
+    """
+    Keeps the current members and which of them have a wrong successor
+    pointer, i.e. one that is not the next member. A single member may also
+    have no successor. The state is ideal when no pointer is wrong.
 
-def update_responsibilites(pointers: dict[str, Pointer], all_keys: set[str], ongoing_responsibilities: dict[str, set[str]], responsible_intervals: OrderedDict[str, ResponsibleStart | ResponsibleEnd], time: str) -> dict[str, set[str]]:
-    new_responsibilities = {}
-    for pointer in pointers.values():
+    Each change only checks the members whose next member or pointer changed.
+    """
+
+    def __init__(self, pointers: dict[str, Pointer]):
+        self.pointers = pointers
+        self.members = SortedRing()
+        self.wrong : set[str] = set()
+
+    def check(self, node: str):
+        assert node in self.pointers, f"Node {node} not in pointers, pointers:\n{self.pointers}"
+
+        succ = self.pointers[node].succ
+        is_not_successor = succ != self.members.successor(node)
+        is_not_only_node = len(self.members) != 1 or succ is not None
+
+        if is_not_successor and is_not_only_node:
+            self.wrong.add(node)
+        else:
+            self.wrong.discard(node)
+
+    def add_member(self, node: str):
+        assert node not in self.members, f"Node {node} is already a member, current members:\n{self.members}"
+
+        self.members.add(node)
+
+        self.check(node)
+        self.check(self.members.predecessor(node))
+
+    def remove_member(self, node: str):
+        assert node in self.members, f"Node {node} is not a member, current members:\n{self.members}"
+
+        pred = self.members.predecessor(node)
+
+        self.members.remove(node)
+        self.wrong.discard(node)
+
+        if self.members:
+            self.check(pred)
+
+    def set_pointer(self, node: str):
+        if node in self.members:
+            self.check(node)
+
+    def is_ideal(self) -> bool:
+        return not self.wrong
+
+
+class ResponsibilityRing:
+    """
+    Keeps the keys each node is responsible for as an arc of the sorted keys.
+
+    A node is responsible for the keys k with between(pred, k, node) for each
+    pred whose successor is the node, and for every key if its own successor
+    is unknown. All those arcs end at the node, so their union is the longest
+    one. When a pointer changes only its old and new successors are updated.
+    """
+
+    def __init__(self, all_keys: set[str], responsible_intervals: OrderedDict[str, ResponsibleStart | ResponsibleEnd]):
+        self.all_keys = all_keys
+        self.sorted_keys = sorted(all_keys)
+        self.responsible_intervals = responsible_intervals
+
+        # Position of each node in the pointers, in insertion order
+        self.order : dict[str, int] = {}
+
+        # Node each pointer makes responsible, its successor or itself
+        self.targets : dict[str, str] = {}
+        self.predecessors : dict[str, set[str]] = {}
+
+        # (first key position, number of keys) of every node some pointer makes responsible
+        self.arcs : dict[str, tuple[int, int]] = {}
+
+        # Responsibility interval of each node that has not ended yet
+        self.ongoing : dict[str, ResponsibleStart] = {}
+
+    def arc(self, pred: str, node: str) -> tuple[int, int]:
+        count = len(self.sorted_keys)
+
+        if pred == node or count == 0:
+            return (0, count)
+
+        first = bisect.bisect_right(self.sorted_keys, pred)
+        last = bisect.bisect_right(self.sorted_keys, node)
+        length = last - first if pred < node else count - first + last
+
+        if length == 0 or length == count:
+            return (0, length)
+
+        return (first % count, length)
+
+    def keys(self, arc: tuple[int, int]) -> Set[str]:
+        first, length = arc
+
+        if length == len(self.sorted_keys):
+            return self.all_keys
+
+        return KeyArc(self.sorted_keys, first, length)
+
+    def set_pointer(self, pointer: Pointer, time: int):
+        """Updates the responsibilities after the pointer of a node is set, at the given time."""
         node = pointer.node
-        succ = pointer.succ
+        target = pointer.succ if pointer.succ is not None else node
+
+        if node not in self.order:
+            self.order[node] = len(self.order)
+
+        previous = self.targets.get(node)
+        if previous == target:
+            return
+
+        if previous is not None:
+            self.predecessors[previous].discard(node)
 
-        if succ is None:
+        self.targets[node] = target
+        self.predecessors.setdefault(target, set()).add(node)
 
-            # print(f"Node {node} is responsible for all keys")
-            new_responsibilities[node] = all_keys
-            continue
+        changed = []
+        for affected in dict.fromkeys((previous, target)):
+            if affected is None:
+                continue
 
-        new_keys = new_responsibilities.get(succ, set())
-        new_responsibilities[succ] = new_keys
+            preds = self.predecessors[affected]
+            prev_arc = self.arcs.get(affected, (0, 0))
 
+            if not preds:
+                # No pointer makes it responsible, its interval stays as it is
+                self.arcs.pop(affected, None)
+                del self.predecessors[affected]
+                continue
 
+            new_arc = max((self.arc(pred, affected) for pred in preds), key=lambda x: x[1])
+            self.arcs[affected] = new_arc
 
-        # print(f"Node {node}, succ {succ}")
-        for key in all_keys:
-            # print(f"Checking key {key}")
-            if between(node, key, succ):
-                # print(f"Adding key {key} to {succ}")
-                new_keys.add(key)
+            if new_arc != prev_arc:
+                changed.append(affected)
 
+        # Every pointer to a node whose keys changed restarts its interval, in pointer order
+        updates = sorted((self.order[pred], changed_node) for changed_node in changed for pred in self.predecessors[changed_node])
 
+        new_keys = {changed_node: self.keys(self.arcs[changed_node]) for changed_node in changed}
 
-    for pointer in pointers.values():
-        node = pointer.succ
+        for (_, changed_node) in updates:
+            self.restart(changed_node, new_keys[changed_node], time)
 
-        if node is None:
-            node = pointer.node
+    def restart(self, node: str, new_keys: Set[str], time: int):
+        responsible_intervals = self.responsible_intervals
 
-        prev_keys = ongoing_responsibilities.get(node, set())
-        new_keys = new_responsibilities.get(node, set())
+        r_start = self.ongoing.get(node)
+        if r_start is not None:
+            r_start.set_end_time(time)
+            r_end = ResponsibleEnd(node, r_start.get_keys(), time, r_start.id)
+            responsible_intervals["End-" + r_end.get_id()] = r_end
 
-        # print(pointer.node, pointer.succ)
-        # pprint(new_keys)
+        r_start = ResponsibleStart(node, new_keys, time, str(len(responsible_intervals)))
+        responsible_intervals[r_start.get_id()] = r_start
+        self.ongoing[node] = r_start
 
-        if new_keys != prev_keys:
-            # print(f"Node {node} keys: {new_keys},\nold keys: {prev_keys}")
-            for r_start in reversed(responsible_intervals.values()):
-                if type(r_start) == ResponsibleStart and r_start.node == node:
-                    # print(f"End {r_start.get_id()} at {time}")
-                    r_start.set_end_time(time)
-                    r_end = ResponsibleEnd(node, r_start.get_keys(), time, r_start.id)
-                    responsible_intervals["End-" + r_end.get_id()] = r_end
-                    break
 
-            r_start = ResponsibleStart(node, new_keys, time, str(len(responsible_intervals)))
-            responsible_intervals[r_start.get_id()] = r_start
+@register("chord")
+class ChordIdealParser(IdealParser):
+    """
+    Follows the successor pointers of the Chord ideal log, e.g.
 
-    return new_responsibilities
+    2024-11-12 19:56:48.781, Successor, 0C0C45F4, null
 
-def get_ideal_responsible(ideal_log: Path, limit_time: str, all_keys: set[str], operations: OrderedDict[str, Operation], member_intervals: OrderedDict[str, MemberStart| MemberEnd]) -> tuple[dict, dict]:
+    Each line is applied once the membership intervals before it have been
+    fed. A line that changes the ideal state waits for the first operation at
+    or after it, which is when the change happens, and for the next one: the
+    log is not followed past the last operation.
+    """
 
-    op_iter = 0
-    op_list = sorted(operations.values(), key=lambda x: x.get_time())
+    def __init__(self, ideal_log: Path, limit_time: int, keys: set[str]):
+        super().__init__(ideal_log, limit_time, keys)
 
-    member_iter = 0
-    member_list = sorted(member_intervals.values(), key=lambda x: x.get_time())
+        self.pointers : dict[str, Pointer] = {}
+        self.ring_consistency = RingConsistency(self.pointers)
 
-    current_members = []
-    
-    pointers : dict[str,Pointer] = {}
+        self.ongoing_ideal = None
+        self.ideal_states = OrderedDict()
 
+        self.responsible_intervals = OrderedDict()
+        self.ring = ResponsibilityRing(keys, self.responsible_intervals)
 
-    ongoing_ideal = None
-    ideal_states = OrderedDict()
+        self.timestamps = TimestampTable()
+        self.file = open(ideal_log, 'r')
 
+        # Membership intervals not applied yet and times of the operations from the last ideal state change on
+        self.member_queue : deque[MemberStart | MemberEnd] = deque()
+        self.op_times : deque[int] = deque()
+        self.last_time = None
 
-    ongoing_responsibilities = {}
-    responsible_intervals = OrderedDict()
+        # Next line of the ideal log and whether it was applied and changed the ideal state
+        self.line = None
+        self.changed = False
+        self.done = False
 
+    def feed(self, event: Operation | MemberStart | MemberEnd):
+        if self.done:
+            return
 
-    with open(ideal_log, 'r') as f:
-        for line in f:
-            time, _, member, succ = line.strip().split(', ')
-            
-            ## Infer current members
-            while member_iter < len(member_list) and member_list[member_iter].get_time() < time:
-                membership_node = member_list[member_iter].get_node()
-                pos = bisect.bisect_left(current_members, membership_node)
+        time = event.get_time()
+        assert self.last_time is None or time >= self.last_time, f"Event {event} fed out of time order"
+        self.last_time = time
 
+        if isinstance(event, (MemberStart, MemberEnd)):
+            self.member_queue.append(event)
+        else:
+            self.op_times.append(time)
 
-                if member_list[member_iter].is_end():
-                    assert not (pos < len(current_members) and current_members[pos] != membership_node), f"Node {member_list[member_iter].get_node()} is not a member, current members:\n{current_members}"
-                    current_members.pop(pos)
-                else:
-                    assert not (pos < len(current_members) and current_members[pos] == membership_node), f"Node {member_list[member_iter].get_node()} is already a member, current members:\n{current_members}"
-                    current_members.insert(pos, membership_node)
+        self.process(final=False)
 
-                    if membership_node not in pointers:
-                        # print(f"Adding {membership_node} to pointers")
-                        pointers[membership_node] = Pointer(membership_node, None)
+    def finish(self):
+        self.process(final=True)
+        return self.ideal_states, self.responsible_intervals
 
+    def stop(self):
+        self.done = True
+        self.file.close()
+        self.member_queue.clear()
+        self.op_times.clear()
 
+    def read_line(self) -> tuple[int, str, str | None] | None:
+        line = self.file.readline()
+        if not line:
+            return None
 
+        time, _, member, succ = line.strip().split(', ')
 
-                member_time = member_list[member_iter].get_time()
+        if succ == "null":
+            succ = None
 
-                ## Update responsibilities
-                ongoing_responsibilities = update_responsibilites(pointers, all_keys, ongoing_responsibilities, responsible_intervals, member_time)
+        return (self.timestamps[time], member, succ)
 
-                ## Update ideal states
-                is_ideal_state = is_ideal(pointers, current_members)
+    def set_ideal(self, is_ideal_state: bool, time: int):
+        if is_ideal_state == (self.ongoing_ideal is not None):
+            return
 
-                if is_ideal_state != (ongoing_ideal is not None):
+        if self.ongoing_ideal is None:
+            self.ongoing_ideal = IdealStart(time, str(len(self.ideal_states)))
+            self.ideal_states[self.ongoing_ideal.get_id()] = self.ongoing_ideal
 
-                    if ongoing_ideal is None:
-                        ongoing_ideal = IdealStart(member_time, str(len(ideal_states)))
-                        ideal_states[ongoing_ideal.get_id()] = ongoing_ideal
+        else:
+            self.ongoing_ideal.set_end_time(time)
 
-                    else:
-                        ongoing_ideal.set_end_time(member_time)
+            end_ideal = IdealEnd(time, self.ongoing_ideal.id)
+            self.ideal_states["End-" + end_ideal.get_id()] = end_ideal
 
-                        end_ideal = IdealEnd(member_time, ongoing_ideal.id)
-                        ideal_states["End-" + end_ideal.get_id()] = end_ideal
+            self.ongoing_ideal = None
 
-                        ongoing_ideal = None
+    def apply_memberships(self, time: int):
+        while self.member_queue and self.member_queue[0].get_time() < time:
+            membership = self.member_queue.popleft()
+            membership_node = membership.get_node()
+            member_time = membership.get_time()
 
+            if membership.is_end():
+                self.ring_consistency.remove_member(membership_node)
+            else:
+                if membership_node not in self.pointers:
+                    self.pointers[membership_node] = Pointer(membership_node, None)
+                    self.ring.set_pointer(self.pointers[membership_node], member_time)
 
+                self.ring_consistency.add_member(membership_node)
 
-                member_iter += 1
+            self.set_ideal(self.ring_consistency.is_ideal(), member_time)
 
+    def process(self, final: bool):
+        while not self.done:
+            if self.line is None:
+                self.line = self.read_line()
 
+                if self.line is None:
+                    self.stop()
+                    return
 
-            if time > limit_time:
-                break
+            time, member, succ = self.line
 
-            if succ == "null":
-                succ = None
+            if not self.changed:
+                # Membership intervals before the line may still be fed
+                if not final and (self.last_time is None or self.last_time < time):
+                    return
 
-            pointers[member] = Pointer(member, succ)
+                self.apply_memberships(time)
 
+                if time > self.limit_time:
+                    self.stop()
+                    return
 
+                self.pointers[member] = Pointer(member, succ)
 
-            # print("-"*20)
-            # print(f"Time: {time}")
-            # print(f"Line: {line}")
-            # pprint(pointers)
+                self.ring.set_pointer(self.pointers[member], time)
+                self.ring_consistency.set_pointer(member)
 
-            #### Responsible
-            ongoing_responsibilities = update_responsibilites(pointers, all_keys, ongoing_responsibilities, responsible_intervals, time)
-            # new_responsibilities = {}
-            # for pointer in pointers.values():
-            #     node = pointer.node
-            #     succ = pointer.succ
-            #
-            #     if succ is None:
-            #
-            #         # print(f"Node {node} is responsible for all keys")
-            #         new_responsibilities[node] = all_keys
-            #         continue
-            #
-            #     new_keys = new_responsibilities.get(succ, set())
-            #     new_responsibilities[succ] = new_keys
-            #
-            #
-            #
-            #     # print(f"Node {node}, succ {succ}")
-            #     for key in all_keys:
-            #         # print(f"Checking key {key}")
-            #         if openChord_between(node, key, succ):
-            #             # print(f"Adding key {key} to {succ}")
-            #             new_keys.add(key)
-            #
-            #
-            #
-            # for pointer in pointers.values():
-            #     node = pointer.succ
-            #
-            #     if node is None:
-            #         node = pointer.node
-            #
-            #     prev_keys = ongoing_responsibilities.get(node, set())
-            #     new_keys = new_responsibilities.get(node, set())
-            #
-            #     # print(pointer.node, pointer.succ)
-            #     # pprint(new_keys)
-            #
-            #     if new_keys != prev_keys:
-            #         # print(f"Node {node} keys: {new_keys},\nold keys: {prev_keys}")
-            #         for r_start in reversed(responsible_intervals.values()):
-            #             if type(r_start) == ResponsibleStart and r_start.node == node:
-            #                 # print(f"End {r_start.get_id()} at {time}")
-            #                 r_start.set_end_time(time)
-            #                 r_end = ResponsibleEnd(node, r_start.get_keys(), time, r_start.id)
-            #                 responsible_intervals["End-" + r_end.get_id()] = r_end
-            #                 break
-            #
-            #         r_start = ResponsibleStart(node, new_keys, time, str(len(responsible_intervals)))
-            #         responsible_intervals[r_start.get_id()] = r_start
-            #
-            #
-            #
-            #
-            # ongoing_responsibilities = new_responsibilities
+                self.changed = self.ring_consistency.is_ideal() != (self.ongoing_ideal is not None)
 
+            # The ideal log is in time order, so no later change happens before these operations
+            op_times = self.op_times
+            while len(op_times) > 1 and op_times[0] < time:
+                op_times.popleft()
 
-            #### Ideal
-            new_ideal = is_ideal(pointers, current_members)
+            if not self.changed:
+                self.line = None
+                continue
 
-            if new_ideal != (ongoing_ideal is not None):
+            if len(op_times) < 2:
+                if final:
+                    self.stop()
 
-                while op_iter < len(op_list) - 1 and op_list[op_iter].get_time() < time:
-                    op_iter += 1
+                return
 
-                if op_iter == len(op_list) - 1:
-                    return ideal_states, responsible_intervals
+            self.set_ideal(self.ongoing_ideal is None, op_times[0])
 
-                time = op_list[op_iter].get_time()
+            self.line = None
+            self.changed = False
 
-                if ongoing_ideal is None:
-                    ongoing_ideal = IdealStart(time, str(len(ideal_states)))
-                    ideal_states[ongoing_ideal.get_id()] = ongoing_ideal
-
-                else:
 
-
-                    ongoing_ideal.set_end_time(time)
-
-                    end_ideal = IdealEnd(time, ongoing_ideal.id)
-                    ideal_states["End-" + end_ideal.get_id()] = end_ideal
-
-                    ongoing_ideal = None
-
-
-    return ideal_states, responsible_intervals
+def get_ideal_responsible(ideal_log: Path, limit_time: int, all_keys: set[str], operations: OrderedDict[str, Operation], member_intervals: OrderedDict[str, MemberStart| MemberEnd]) -> tuple[dict, dict]:
+    return parse_ideal(ChordIdealParser, ideal_log, limit_time, all_keys, event_stream(operations, member_intervals))
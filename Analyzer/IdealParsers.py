@@ -0,0 +1,268 @@
+import copy
+import heapq
+import importlib.util
+import logging
+import sys
+
+from abc import ABC, abstractmethod
+from functools import partial
+from itertools import chain
+from importlib.metadata import entry_points
+from pathlib import Path
+from types import ModuleType
+from typing import Callable, Iterable, Iterator, OrderedDict
+
+from Operations import (
+    IdealEnd,
+    IdealStart,
+    MemberEnd,
+    MemberStart,
+    Operation,
+    Reply,
+    ResponsibleEnd,
+    ResponsibleStart
+)
+from Timestamps import INITIAL_TIME, TimestampTable, format_timestamp
+
+
+# Entry point group of ideal parsers installed as packages
+ENTRY_POINT_GROUP = "atl.ideal_parsers"
+
+# Ideal parsers shipped with the analyzer, loaded on first use
+BUILTIN_PARSERS = {
+    "chord": Path(__file__).with_name("ChordIdeal.py"),
+}
+
+# Function of the ideal parser modules that parse the whole ideal log at once
+LEGACY_FUNCTION = "get_ideal_responsible"
+
+
+class IdealParser(ABC):
+    """
+    Streaming interface of the ideal state backends.
+
+    A backend is created for an ideal log, the time of the last operation and
+    the keys of the log. It is fed the operations and membership intervals in
+    time order and returns the ideal and responsibility intervals on finish.
+
+    Times are ints, microseconds since the epoch as given by
+    Timestamps.parse_timestamp, with INITIAL_TIME for the intervals carried
+    over from before the analyzed window. This holds for the limit time, the
+    events fed and the intervals returned, so timestamps read from the ideal
+    log must be converted with parse_timestamp or a TimestampTable.
+    """
+
+    def __init__(self, ideal_log: Path, limit_time: int, keys: set[str]):
+        self.ideal_log = ideal_log
+        self.limit_time = limit_time
+        self.keys = keys
+
+    @abstractmethod
+    def feed(self, event: Operation | MemberStart | MemberEnd):
+        """Takes the next operation or membership interval, in time order."""
+
+    @abstractmethod
+    def finish(self) -> tuple[OrderedDict[str, IdealStart | IdealEnd], OrderedDict[str, ResponsibleStart | ResponsibleEnd]]:
+        """Returns the ideal and responsibility intervals once every event was fed."""
+
+
+IdealParserFactory = Callable[[Path, int, set[str]], IdealParser]
+
+# Registered backends, by name
+IDEAL_PARSERS : dict[str, IdealParserFactory] = {}
+
+# Modules loaded from a path, by resolved path
+loaded_modules : dict[Path, ModuleType] = {}
+
+
+def register(name: str):
+    """Class decorator registering an ideal parser backend under the given name."""
+    def decorator(parser: type[IdealParser]) -> type[IdealParser]:
+        if name in IDEAL_PARSERS and IDEAL_PARSERS[name] is not parser:
+            raise ValueError(f"Ideal parser {name} already registered")
+
+        IDEAL_PARSERS[name] = parser
+        return parser
+
+    return decorator
+
+
+class FunctionIdealParser(IdealParser):
+    """
+    Backend of a module with a get_ideal_responsible function, which gets every event at once on finish.
+
+    These functions predate the int times, so they get copies of the events
+    with log timestamps as strings, under their keys in the analyzer, and the
+    times of the intervals they return are converted back.
+    """
+
+    def __init__(self, function: Callable, ideal_log: Path, limit_time: int, keys: set[str]):
+        super().__init__(ideal_log, limit_time, keys)
+        self.function = function
+        self.operations : OrderedDict[str, Operation] = OrderedDict()
+        self.member_intervals : OrderedDict[str, MemberStart | MemberEnd] = OrderedDict()
+
+    def feed(self, event: Operation | MemberStart | MemberEnd):
+        event = copy.copy(event)
+        event.set_time(format_timestamp(event.get_time()))
+        if event.get_end_time() is not None:
+            event.set_end_time(format_timestamp(event.get_end_time()))
+
+        if isinstance(event, MemberEnd):
+            self.member_intervals["End-" + event.get_id()] = event
+        elif isinstance(event, MemberStart):
+            self.member_intervals[event.get_id()] = event
+        elif isinstance(event, Reply):
+            self.operations["Reply-" + event.get_id()] = event
+        else:
+            self.operations[event.get_id()] = event
+
+    def finish(self):
+        (ideal_states, responsibility) = self.function(self.ideal_log, format_timestamp(self.limit_time), self.keys, self.operations, self.member_intervals)
+
+        timestamps = TimestampTable({format_timestamp(INITIAL_TIME): INITIAL_TIME})
+
+        def to_int(time: int | str | None) -> int | None:
+            return timestamps[time] if isinstance(time, str) else time
+
+        for interval in chain(ideal_states.values(), responsibility.values()):
+            interval.set_time(to_int(interval.get_time()))
+            interval.set_end_time(to_int(interval.get_end_time()))
+
+        return (ideal_states, responsibility)
+
+
+def time_ordered(events: dict[str, Operation | MemberStart | MemberEnd], name: str) -> Iterable[Operation | MemberStart | MemberEnd]:
+    """
+    The events in time order. They are in log order, which is the time order
+    but for the jitter of distributed logs, so they are only sorted when an
+    event is earlier than the one before it.
+    """
+    last_time = None
+
+    for event in events.values():
+        time = event.get_time()
+        if last_time is not None and time < last_time:
+            logging.warning(f"{name.capitalize()} out of time order, sorting them: {event} after time {last_time}")
+            return sorted(events.values(), key=lambda x: x.get_time())
+
+        last_time = time
+
+    return events.values()
+
+
+def event_stream(operations: dict[str, Operation], member_intervals: dict[str, MemberStart | MemberEnd]) -> Iterator[Operation | MemberStart | MemberEnd]:
+    """
+    Lazily merges the operations and membership intervals in time order.
+
+    Adjacent log lines out of time order, e.g. a lookup logged after a later
+    reply, are sorted before they are merged:
+
+    >>> from Operations import Lookup, Reply
+    >>> operations = {"1": Lookup(10, "Lookup", "1", 0, "A", "K"), "Reply-1": Reply(30, "ReplyLookup", "1", 0, "A"), "2": Lookup(20, "Lookup", "2", 1, "B", "K")}
+    >>> members = {"M1": MemberStart("B", 25, "M1"), "M0": MemberStart("A", 5, "M0")}
+    >>> [event.get_time() for event in event_stream(operations, members)]
+    [5, 10, 20, 25, 30]
+    """
+    return heapq.merge(time_ordered(operations, "operations"), time_ordered(member_intervals, "membership intervals"), key=lambda x: x.get_time())
+
+
+def load_module(path: Path) -> ModuleType:
+    path = path.resolve()
+
+    if path in loaded_modules:
+        return loaded_modules[path]
+
+    # Already imported by name, e.g. a builtin parser
+    module = sys.modules.get(path.stem)
+    if module is not None and getattr(module, "__file__", None) and Path(module.__file__).resolve() == path:
+        loaded_modules[path] = module
+        return module
+
+    name = path.stem if path.stem not in sys.modules else f"ideal_parser_{len(loaded_modules)}_{path.stem}"
+
+    if not path.is_file():
+        raise ImportError(f"Ideal parser file {path} not found")
+
+    spec = importlib.util.spec_from_file_location(name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Cannot load ideal parser {path}")
+
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+
+    loaded_modules[path] = module
+    logging.debug(f"Loaded ideal parser module {path}")
+
+    return module
+
+
+def module_parser(module: ModuleType) -> IdealParserFactory:
+    """The first backend registered by the module, or its get_ideal_responsible function."""
+    for parser in IDEAL_PARSERS.values():
+        if getattr(parser, "__module__", None) == module.__name__:
+            return parser
+
+    function = getattr(module, LEGACY_FUNCTION, None)
+    if function is None:
+        raise ImportError(f"No ideal parser registered and no {LEGACY_FUNCTION} function in {module.__name__}")
+
+    return partial(FunctionIdealParser, function)
+
+
+def entry_point_parser(name: str) -> IdealParserFactory | None:
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        if entry_point.name != name:
+            continue
+
+        loaded = entry_point.load()
+
+        if isinstance(loaded, ModuleType):
+            return module_parser(loaded)
+
+        if isinstance(loaded, type) and issubclass(loaded, IdealParser):
+            return loaded
+
+        return partial(FunctionIdealParser, loaded)
+
+    return None
+
+
+def load_ideal_parser(source: str) -> IdealParserFactory:
+    """
+    Finds the ideal parser backend named by source: a registered or builtin
+    backend, the path of a python file or the name of an entry point.
+    Raises ValueError or ImportError if there is no such backend.
+    """
+    if source in IDEAL_PARSERS:
+        return IDEAL_PARSERS[source]
+
+    if source in BUILTIN_PARSERS:
+        load_module(BUILTIN_PARSERS[source])
+        assert source in IDEAL_PARSERS, f"Builtin ideal parser {source} not registered by {BUILTIN_PARSERS[source]}"
+        return IDEAL_PARSERS[source]
+
+    path = Path(source)
+    if path.suffix == ".py" or path.exists():
+        return module_parser(load_module(path))
+
+    parser = entry_point_parser(source)
+    if parser is None:
+        raise ValueError(f"Ideal parser {source} is not registered, a python file or an entry point of {ENTRY_POINT_GROUP}")
+
+    return parser
+
+
+def parse_ideal(parser: IdealParserFactory, ideal_log: Path, limit_time: int, keys: set[str], events: Iterable[Operation | MemberStart | MemberEnd]):
+    """Feeds the events to a new backend and returns its ideal and responsibility intervals."""
+    ideal_parser = parser(ideal_log, limit_time, keys)
+
+    for event in events:
+        ideal_parser.feed(event)
+
+    return ideal_parser.finish()
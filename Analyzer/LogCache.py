@@ -0,0 +1,176 @@
+import hashlib
+import logging
+import os
+import struct
+
+from array import array
+from pathlib import Path
+from typing import BinaryIO
+
+from LogParser import PARSER_VERSION, LogColumns, string_table
+
+
+CACHE_SUFFIX = ".atlcache"
+
+MAGIC = b"ATLC"
+
+# Magic, parser version, log size, log modification time and log digest
+HEADER = struct.Struct("<4sIQQ32s")
+
+# Number of entries followed by the size in bytes of a table or column
+LENGTH = struct.Struct("<QQ")
+
+HASH_BLOCK_SIZE = 1 << 22
+
+COLUMNS = ("time", "optype", "id", "node", "key", "value")
+
+
+def cache_path(log: Path) -> Path:
+    return log.with_name(log.name + CACHE_SUFFIX)
+
+
+def log_digest(log: Path, size: int | None = None) -> bytes:
+    """Digest of the log, or of its first size bytes."""
+    digest = hashlib.sha256()
+    remaining = float("inf") if size is None else size
+
+    with log.open("rb") as f:
+        while remaining > 0 and (block := f.read(min(remaining, HASH_BLOCK_SIZE))):
+            digest.update(block)
+            remaining -= len(block)
+
+    return digest.digest()
+
+
+def log_stamp(log: Path) -> tuple[int, int, bytes]:
+    """
+    Size, modification time and digest of the log, taken before parsing it so
+    the files derived from it are not recorded as valid for lines appended
+    meanwhile.
+    """
+    stat = log.stat()
+    return (stat.st_size, stat.st_mtime_ns, log_digest(log, stat.st_size))
+
+
+def is_unchanged(log: Path, stamp: tuple[int, int, bytes]) -> bool:
+    stat = log.stat()
+    return (stat.st_size, stat.st_mtime_ns) == stamp[:2]
+
+
+def read_exactly(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError(f"Truncated file, read {len(data)} of {size} bytes")
+
+    return data
+
+
+def write_table(f: BinaryIO, strings: list[str | None]):
+    # Lines were split on newlines, so no string contains one
+    data = "\n".join(strings[1:]).encode("utf-8")
+    f.write(LENGTH.pack(len(strings) - 1, len(data)))
+    f.write(data)
+
+
+def read_table(f: BinaryIO):
+    count, size = LENGTH.unpack(read_exactly(f, LENGTH.size))
+    strings = read_exactly(f, size).decode("utf-8").split("\n") if count else []
+    if len(strings) != count:
+        raise ValueError(f"Corrupted string table of {len(strings)} strings instead of {count}")
+
+    return string_table([None, *strings])
+
+
+def write_column(f: BinaryIO, column: array):
+    data = column.tobytes()
+    f.write(LENGTH.pack(len(column), len(data)))
+    f.write(data)
+
+
+def read_column(f: BinaryIO) -> array:
+    count, size = LENGTH.unpack(read_exactly(f, LENGTH.size))
+    column = array("i")
+    if size != count * column.itemsize:
+        raise ValueError(f"Corrupted column of {size} bytes for {count} entries")
+
+    column.frombytes(read_exactly(f, size))
+
+    return column
+
+
+def write_header(f: BinaryIO, stamp: tuple[int, int, bytes], magic: bytes = MAGIC):
+    f.write(HEADER.pack(magic, PARSER_VERSION, *stamp))
+
+
+def read_header(f: BinaryIO, log: Path, magic: bytes = MAGIC) -> bool:
+    """
+    Checks whether the file derived from the log is still valid.
+
+    It is valid if it was written by the same parser version for a log of the
+    same size and either the same modification time or the same content.
+    """
+    stat = log.stat()
+    file_magic, version, size, mtime, digest = HEADER.unpack(read_exactly(f, HEADER.size))
+
+    if file_magic != magic or version != PARSER_VERSION or size != stat.st_size:
+        return False
+
+    return mtime == stat.st_mtime_ns or digest == log_digest(log)
+
+
+def load_columns(log: Path) -> LogColumns | None:
+    """Loads the parsed columns of the log from its cache. Returns None if there is no valid cache."""
+    path = cache_path(log)
+    if not path.exists():
+        return None
+
+    try:
+        with path.open("rb") as f:
+            if not read_header(f, log):
+                logging.info(f"Cache {path} is outdated")
+                return None
+
+            columns = LogColumns()
+            columns.strings = read_table(f)
+            columns.optypes = read_table(f)
+
+            for name in COLUMNS:
+                setattr(columns, name, read_column(f))
+
+    except (OSError, ValueError, struct.error) as e:
+        logging.warning(f"Failed to read cache {path}: {e}")
+        return None
+
+    logging.info(f"Loaded {len(columns)} lines from cache {path}")
+    return columns
+
+
+def save_columns(log: Path, columns: LogColumns, stamp: tuple[int, int, bytes]):
+    """Writes the columns parsed from the whole log, stamped by log_stamp before parsing it, to its cache."""
+    path = cache_path(log)
+
+    if not is_unchanged(log, stamp):
+        logging.warning(f"Log {log} changed while it was parsed, not writing cache {path}")
+        return
+
+    temporary = path.with_name(path.name + f".{os.getpid()}")
+
+    try:
+        with temporary.open("wb") as f:
+            write_header(f, stamp)
+
+            write_table(f, columns.strings.strings)
+            write_table(f, columns.optypes.strings)
+
+            for name in COLUMNS:
+                write_column(f, getattr(columns, name))
+
+        # Concurrent runs never see a partially written cache
+        os.replace(temporary, path)
+
+    except OSError as e:
+        logging.warning(f"Failed to write cache {path}: {e}")
+        temporary.unlink(missing_ok=True)
+        return
+
+    logging.info(f"Saved {len(columns)} lines to cache {path}")
@@ -0,0 +1,424 @@
+import bisect
+import logging
+import os
+import pickle
+import struct
+
+from array import array
+from pathlib import Path
+from typing import BinaryIO, OrderedDict
+
+from LogCache import is_unchanged, read_header, write_header
+from LogParser import (
+    KEY_OPTYPES,
+    OPERATION_BUILDERS,
+    READ_BLOCK_SIZE,
+    LogColumns,
+    build_operations,
+    build_rows,
+    column_rows,
+    read_columns,
+    tokenize_block,
+)
+from Operations import (
+    UNUSED_TAG,
+    Operation,
+)
+from Timestamps import TimestampTable
+
+
+INDEX_SUFFIX = ".atlindex"
+
+MAGIC = b"ATLI"
+
+INDEX_STRIDE = 4096
+
+# Operations whose replies change the membership, which detect_members replays from the first one
+MEMBERSHIP_OPTYPES = ("Join", "Leave", "Fail")
+
+# Groups of optypes, each of which may hold the first operation detect_members sees depending on the trace flags
+FIRST_OPTYPES = (("Store", "Join", "Leave", "Fail"), ("Lookup",), ("FindNode",))
+
+
+class Checkpoint:
+    """State of the log reader before one of the lines of the log."""
+
+    def __init__(self, line: int, offset: int, time: str, op_counts: dict[str, int]):
+        self.line = line
+        self.offset = offset
+        self.time = time
+        self.op_counts = op_counts
+
+
+class LogIndex:
+    """
+    Seekable index of a log.
+
+    A checkpoint every stride lines records the byte offset and timestamp of
+    its line and the operation counts before it. Operations open across a
+    checkpoint are recorded with the line they are replied at, so the ones
+    still open at a checkpoint can be read before reading the log from it.
+
+    Some completed operations still matter after their reply: membership
+    changes, the first store of each key and value pair and the first
+    operation of the log. They are recorded with the offsets of their start
+    and reply lines. Nodes, keys and values are recorded with the line they
+    first appear at.
+    """
+
+    def __init__(self, stride: int = INDEX_STRIDE):
+        self.stride = stride
+        self.lines = 0
+
+        self.checkpoints : list[Checkpoint] = []
+
+        # Start line, start offset, tag and reply line, which is the number of lines if never replied
+        self.spanning : list[tuple[int, int, int, int]] = []
+
+        # Start line, start offset, reply line, reply offset and tag
+        self.carried : list[tuple[int, int, int, int, int]] = []
+
+        self.nodes : list[tuple[int, str]] = []
+        self.keys : list[tuple[int, str]] = []
+        self.values : list[tuple[int, str]] = []
+
+    def checkpoint_before(self, line: int, time: str) -> Checkpoint:
+        """Returns the latest checkpoint at or before line whose preceding lines are all before time."""
+        times = [checkpoint.time for checkpoint in self.checkpoints]
+        position = min(line // self.stride, bisect.bisect_left(times, time) - 1)
+
+        return self.checkpoints[max(position, 0)]
+
+    def read_line(self, log: BinaryIO, line: int) -> str:
+        """Reads a line of the log, skipping at most stride lines from the preceding checkpoint."""
+        checkpoint = self.checkpoints[line // self.stride]
+        log.seek(checkpoint.offset)
+
+        for _ in range(line - checkpoint.line):
+            log.readline()
+
+        return log.readline().decode("utf-8")
+
+    def find_time(self, log: BinaryIO, time: str, after: bool = False) -> int:
+        """Returns the first line of the log at or, if after is set, strictly after time."""
+        times = [checkpoint.time for checkpoint in self.checkpoints]
+        position = bisect.bisect_right(times, time) if after else bisect.bisect_left(times, time)
+        checkpoint = self.checkpoints[max(position - 1, 0)]
+
+        log.seek(checkpoint.offset)
+        for line in range(checkpoint.line, self.lines):
+            if is_at_time(line_time(log.readline().decode("utf-8")), time, after):
+                return line
+
+        return self.lines
+
+
+def index_path(log: Path) -> Path:
+    return log.with_name(log.name + INDEX_SUFFIX)
+
+
+def line_time(line: str) -> str:
+    return line.strip().split(", ", 1)[0].strip(",")
+
+
+def is_at_time(line_time: str, time: str, after: bool) -> bool:
+    return line_time > time if after else line_time >= time
+
+
+def find_time_line(log: BinaryIO, time: str, after: bool = False) -> int:
+    """
+    Returns the first line of the log at or, if after is set, strictly after time.
+
+    Binary searches the byte offsets of the log for the line, then counts the
+    lines before it, without parsing them.
+    """
+    def line_start(position: int) -> int:
+        if position > 0:
+            log.seek(position - 1)
+            log.readline()
+            return log.tell()
+        return 0
+
+    low, high = 0, log.seek(0, os.SEEK_END)
+
+    while low < high:
+        middle = (low + high) // 2
+        log.seek(line_start(middle))
+        line = log.readline()
+
+        if not line or is_at_time(line_time(line.decode("utf-8")), time, after):
+            high = middle
+        else:
+            low = middle + 1
+
+    return count_lines(log, line_start(low))
+
+
+def count_lines(log: BinaryIO, end: int | None = None) -> int:
+    """Counts the lines of the log starting before the byte offset end, or in the whole log."""
+    if end is None:
+        end = log.seek(0, os.SEEK_END)
+
+    lines = 0
+
+    log.seek(0)
+    remaining = end
+    while remaining > 0:
+        block = log.read(min(remaining, READ_BLOCK_SIZE))
+        lines += block.count(b"\n")
+        remaining -= len(block)
+
+    # The last line may not end with a newline
+    if end > 0 and end == log.seek(0, os.SEEK_END):
+        log.seek(end - 1)
+        lines += log.read(1) != b"\n"
+
+    return lines
+
+
+def time_window(log: Path, index: LogIndex | None, from_time: str | None, to_time: str | None) -> tuple[int, int]:
+    """Returns the first line at or after from_time and the first line after to_time."""
+    find = index.find_time if index is not None else find_time_line
+
+    with log.open("rb") as f:
+        first = find(f, from_time, False) if from_time is not None else 0
+
+        if to_time is not None:
+            end = find(f, to_time, True)
+        else:
+            end = index.lines if index is not None else count_lines(f)
+
+    return first, end
+
+
+def line_offsets(log: Path) -> array:
+    offsets = array("q")
+    position = 0
+
+    with log.open("rb") as f:
+        for line in f:
+            offsets.append(position)
+            position += len(line)
+
+    return offsets
+
+
+def build_index(log: Path, columns: LogColumns, stride: int = INDEX_STRIDE) -> LogIndex | None:
+    """
+    Builds the index of the log from the columns of all of its lines.
+    Returns None if the log no longer has the lines of the columns.
+    """
+    offsets = line_offsets(log)
+    if len(offsets) != len(columns):
+        logging.warning(f"Log {log} has {len(offsets)} lines, parsed {len(columns)}, not indexing it")
+        return None
+
+    index = LogIndex(stride)
+    index.lines = len(columns)
+
+    op_counts = {}
+
+    # Start line, tag, optype, key and value pair and whether it is the first of its group
+    open_operations : dict[str, tuple[int, int, str, tuple[str, str], bool]] = {}
+
+    stored_pairs = set()
+    first_optypes = list(FIRST_OPTYPES)
+
+    nodes = {}
+    keys = {}
+    values = {}
+
+    for (line, (time, optype, id, node, key, value)) in enumerate(column_rows(columns)):
+
+        if line % stride == 0:
+            index.checkpoints.append(Checkpoint(line, offsets[line], time, dict(op_counts)))
+
+        if optype in OPERATION_BUILDERS:
+            tag = op_counts[optype] = op_counts.get(optype, 0) + 1
+
+            is_first = False
+            for group in first_optypes:
+                if optype in group:
+                    first_optypes.remove(group)
+                    is_first = True
+                    break
+
+            open_operations[id] = (line, tag, optype, (key, value), is_first)
+
+            if node is not None:
+                nodes.setdefault(node, line)
+            if optype in KEY_OPTYPES:
+                keys.setdefault(key, line)
+            if optype == "Store" and value is not None:
+                values.setdefault(value, line)
+
+        elif optype is not None and "Reply" in optype:
+            operation = open_operations.pop(id, None)
+
+            if operation is not None:
+                op_counts[optype] = op_counts.get(optype, 0) + 1
+
+                (start, tag, start_optype, pair, is_first) = operation
+
+                if line - line % stride > start:
+                    index.spanning.append((start, offsets[start], tag, line))
+
+                is_new_pair = start_optype == "Store" and pair not in stored_pairs
+
+                if is_first or is_new_pair or start_optype in MEMBERSHIP_OPTYPES:
+                    index.carried.append((start, offsets[start], line, offsets[line], tag))
+                    if is_new_pair:
+                        stored_pairs.add(pair)
+
+            if node is not None:
+                nodes.setdefault(node, line)
+
+            # The key column holds the first result of the reply
+            reply_optype = optype.replace("Reply", "")
+            if reply_optype == "FindNode" and key is not None:
+                nodes.setdefault(key, line)
+            elif reply_optype == "Lookup" and key is not None:
+                values.setdefault(key, line)
+
+    for (start, tag, _, _, _) in open_operations.values():
+        index.spanning.append((start, offsets[start], tag, index.lines))
+
+    if not index.checkpoints:
+        index.checkpoints.append(Checkpoint(0, 0, "", op_counts))
+
+    index.nodes = [(line, node) for (node, line) in nodes.items()]
+    index.keys = [(line, key) for (key, line) in keys.items()]
+    index.values = [(line, value) for (value, line) in values.items()]
+
+    logging.info(f"Indexed {index.lines} lines in {len(index.checkpoints)} checkpoints, {len(index.carried)} carried operations")
+
+    return index
+
+
+def load_index(log: Path) -> LogIndex | None:
+    """Loads the index of the log. Returns None if there is no valid index."""
+    path = index_path(log)
+    if not path.exists():
+        return None
+
+    try:
+        with path.open("rb") as f:
+            if not read_header(f, log, MAGIC):
+                logging.info(f"Index {path} is outdated")
+                return None
+
+            index = pickle.load(f)
+
+    # Unpickling a truncated, foreign or stale index can raise about anything
+    except (OSError, ValueError, struct.error, pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError, TypeError) as e:
+        logging.warning(f"Failed to read index {path}: {e}")
+        return None
+
+    if not isinstance(index, LogIndex):
+        logging.warning(f"Failed to read index {path}: not an index")
+        return None
+
+    logging.info(f"Loaded index {path}")
+    return index
+
+
+def save_index(log: Path, index: LogIndex, stamp: tuple[int, int, bytes]):
+    """Writes the index of the log, stamped by log_stamp before parsing it."""
+    path = index_path(log)
+
+    if not is_unchanged(log, stamp):
+        logging.warning(f"Log {log} changed while it was indexed, not writing index {path}")
+        return
+
+    temporary = path.with_name(path.name + f".{os.getpid()}")
+
+    try:
+        with temporary.open("wb") as f:
+            write_header(f, stamp, MAGIC)
+            pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temporary, path)
+
+    except OSError as e:
+        logging.warning(f"Failed to write index {path}: {e}")
+        temporary.unlink(missing_ok=True)
+        return
+
+    logging.info(f"Saved index {path}")
+
+
+def read_look_behind(log: Path, index: LogIndex, checkpoint: Checkpoint, operations: OrderedDict[str, Operation]):
+    """
+    Reads the lines before the checkpoint that still matter after it.
+
+    These are the operations open at the checkpoint and the carried operations
+    replied before it, which are built with the tags they have in the whole log.
+    """
+    entries = [(start, offset, tag) for (start, offset, tag, reply) in index.spanning if start < checkpoint.line <= reply]
+    for (start, start_offset, reply, reply_offset, tag) in index.carried:
+        if reply < checkpoint.line:
+            entries.append((start, start_offset, tag))
+            entries.append((reply, reply_offset, UNUSED_TAG))
+
+    entries.sort()
+
+    lines = []
+    with log.open("rb") as f:
+        for (_, offset, _) in entries:
+            f.seek(offset)
+            lines.append(f.readline().decode("utf-8").rstrip("\r\n"))
+
+    if not lines:
+        return
+
+    columns = LogColumns()
+    tokenize_block("\n".join(lines), columns, float("inf"))
+
+    build_rows(column_rows(columns), operations, dict(), TimestampTable())
+
+    ids = list(map(columns.strings.strings.__getitem__, columns.id))
+    for ((_, _, tag), id) in zip(entries, ids):
+        if tag != UNUSED_TAG:
+            operations[id].tag = tag
+
+    for id in ids:
+        reply = operations.get("Reply-" + id)
+        if reply is not None:
+            reply.tag = operations[id].tag
+
+    logging.info(f"Read {len(lines)} look-behind lines before line {checkpoint.line}")
+
+
+def read_window(log: Path, index: LogIndex, starting_line, line_count) -> tuple[int | None, set[str], set[str], set[str], set[int], OrderedDict[str, Operation]]:
+    """
+    Builds the same result as Analyzer.read_log for the window of the log.
+
+    Reading starts at the latest checkpoint before the window, after the
+    look-behind lines that carry the state of the preceding lines over.
+    """
+    first_line = max(starting_line, 1) - 1
+
+    checkpoint = index.checkpoints[0]
+    if 0 < first_line < index.lines:
+        with log.open("rb") as f:
+            starting_time = line_time(index.read_line(f, first_line))
+
+        checkpoint = index.checkpoint_before(first_line, starting_time)
+
+    operations = OrderedDict()
+    if checkpoint.line > 0:
+        read_look_behind(log, index, checkpoint, operations)
+
+    with log.open("r", encoding="utf-8") as f:
+        f.seek(checkpoint.offset)
+        columns = read_columns(f, starting_line + line_count - checkpoint.line)
+
+    initial_time, nodes, keys, values, times, operations = build_operations(
+        columns, starting_line - checkpoint.line, line_count, operations, dict(checkpoint.op_counts)
+    )
+
+    nodes.update(node for (line, node) in index.nodes if line < checkpoint.line)
+    keys.update(key for (line, key) in index.keys if line < checkpoint.line)
+    values.update(value for (line, value) in index.values if line < checkpoint.line)
+
+    return initial_time, nodes, keys, values, times, operations
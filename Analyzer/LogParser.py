@@ -0,0 +1,413 @@
+import gc
+import logging
+import os
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from io import TextIOWrapper
+from pathlib import Path
+from typing import OrderedDict
+
+from Operations import (
+    NO_VALUE,
+    UNUSED_TAG,
+    Operation,
+    Join,
+    Leave,
+    Fail,
+    FunctionalOperation,
+    FindNode,
+    Lookup,
+    Store,
+    Reply,
+)
+from Timestamps import TimestampTable
+
+
+# Bump whenever the columns produced from a log change, invalidating cached logs
+PARSER_VERSION = 1
+
+READ_BLOCK_SIZE = 1 << 22
+
+# String index of absent fields
+MISSING = 0
+
+IGNORED_OPTYPES = ("StartStableRegimen", "EndStableRegimen")
+
+# Patterns of components that start or end with a comma, which read_log strips
+STRAY_COMMAS = (",, ", ", ,", ",\n", "\n,")
+
+
+class StringTable(dict):
+    """Interns strings to consecutive indices, with MISSING reserved for absent fields."""
+
+    def __init__(self):
+        super().__init__({None: MISSING})
+        self.strings : list[str | None] = [None]
+
+    def __missing__(self, string: str) -> int:
+        index = len(self.strings)
+        self.strings.append(string)
+        self[string] = index
+        return index
+
+    def __reduce__(self):
+        # Only the strings are pickled, the indices are rebuilt from them
+        return (string_table, (self.strings,))
+
+
+def string_table(strings: list[str | None]) -> StringTable:
+    table = StringTable()
+    table.update(zip(strings, range(len(strings))))
+    table.strings = list(strings)
+
+    return table
+
+
+class LogColumns:
+    """
+    Columnar representation of a parsed log.
+
+    Each line of the log is a row and its fields are stored by position:
+    time, optype, id, node, key and value. For replies the node column
+    holds the replier and the key column the first result argument.
+    Columns store indices into the string table.
+    """
+
+    def __init__(self):
+        self.strings = StringTable()
+        self.optypes = StringTable()
+
+        self.time = array("i")
+        self.optype = array("i")
+        self.id = array("i")
+        self.node = array("i")
+        self.key = array("i")
+        self.value = array("i")
+
+    def __len__(self):
+        return len(self.time)
+
+    def extend(self, other: "LogColumns", max_lines = float("inf")):
+        """Appends the rows of other, translating its string indices to this table."""
+        rows = int(max(0, min(len(other), max_lines - len(self))))
+
+        strings = list(map(self.strings.__getitem__, other.strings.strings))
+        optypes = list(map(self.optypes.__getitem__, other.optypes.strings))
+
+        self.time.extend(map(strings.__getitem__, other.time[:rows]))
+        self.optype.extend(map(optypes.__getitem__, other.optype[:rows]))
+        self.id.extend(map(strings.__getitem__, other.id[:rows]))
+        self.node.extend(map(strings.__getitem__, other.node[:rows]))
+        self.key.extend(map(strings.__getitem__, other.key[:rows]))
+        self.value.extend(map(strings.__getitem__, other.value[:rows]))
+
+
+def read_blocks(log: TextIOWrapper, block_size: int = READ_BLOCK_SIZE):
+    """Yields the text of the log in large blocks of complete lines."""
+    remainder = ""
+    while True:
+        block = log.read(block_size)
+        if not block:
+            break
+
+        block = remainder + block
+        end = block.rfind("\n")
+        if end == -1:
+            remainder = block
+            continue
+
+        remainder = block[end + 1:]
+        yield block[:end]
+
+    if remainder:
+        yield remainder
+
+
+def tokenize_block(block: str, columns: LogColumns, max_lines) -> bool:
+    """Appends the lines of the block to the columns. Returns False once max_lines rows were read."""
+    lines = block.split("\n")
+
+    remaining = max_lines - len(columns)
+    if remaining < len(lines):
+        lines = lines[:int(remaining)]
+
+    lines = [line.strip() for line in lines]
+    stripped = "\n".join(lines)
+
+    rows = [line.split(", ") for line in lines]
+
+    if stripped.startswith(",") or stripped.endswith(",") or any(pattern in stripped for pattern in STRAY_COMMAS):
+        rows = [[component.strip(",") for component in row] for row in rows]
+
+    intern = columns.strings.__getitem__
+
+    columns.time.extend(map(intern, [row[0] for row in rows]))
+    columns.optype.extend(map(columns.optypes.__getitem__, [row[1] for row in rows]))
+    columns.id.extend(map(intern, [row[2] if len(row) > 2 else None for row in rows]))
+    columns.node.extend(map(intern, [row[3] if len(row) > 3 else None for row in rows]))
+    columns.key.extend(map(intern, [row[4] if len(row) > 4 else None for row in rows]))
+    columns.value.extend(map(intern, [row[5] if len(row) > 5 else None for row in rows]))
+
+    return len(columns) < max_lines
+
+
+def read_columns(log: TextIOWrapper, max_lines = float("inf")) -> LogColumns:
+    columns = LogColumns()
+
+    # The rows of a block are short-lived lists, collecting them only slows tokenizing down
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        for block in read_blocks(log):
+            if not tokenize_block(block, columns, max_lines):
+                break
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return columns
+
+
+def chunk_ranges(log: Path, chunks: int) -> list[tuple[int, int]]:
+    """Splits the log in byte ranges of roughly the same size, on line boundaries."""
+    size = log.stat().st_size
+    boundaries = [0]
+
+    with log.open("rb") as f:
+        for i in range(1, chunks):
+            position = size * i // chunks
+            if position <= boundaries[-1]:
+                continue
+
+            # Move to the start of the line following the byte before position
+            f.seek(position - 1)
+            f.readline()
+            boundaries.append(min(f.tell(), size))
+
+    boundaries.append(size)
+
+    return [(start, end) for (start, end) in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def read_chunk(log: Path, start: int, end: int) -> LogColumns:
+    """Parses the lines in the byte range [start, end) of the log."""
+    columns = LogColumns()
+
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        with log.open("rb") as f:
+            f.seek(start)
+            remainder = b""
+
+            while start < end:
+                data = f.read(min(READ_BLOCK_SIZE, end - start))
+                if not data:
+                    break
+                start += len(data)
+
+                data = remainder + data
+                split = data.rfind(b"\n")
+                if start >= end and split != len(data) - 1:
+                    split = len(data)
+
+                if split == -1:
+                    remainder = data
+                    continue
+
+                remainder = data[split + 1:]
+
+                # Lines never break inside a multi-byte character, decode like universal newlines would
+                block = data[:split].decode("utf-8")
+                if "\r" in block:
+                    block = block.replace("\r\n", "\n").replace("\r", "\n")
+                    if block.endswith("\n"):
+                        block = block[:-1]
+
+                if block:
+                    tokenize_block(block, columns, float("inf"))
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return columns
+
+
+def read_columns_parallel(log: Path, jobs: int = os.cpu_count() or 1, max_lines = float("inf")) -> LogColumns:
+    """
+    Parses the log in chunks in separate worker processes.
+
+    Chunks are merged back in file order, so building the operations from the
+    result numbers them and matches their replies as a sequential read does.
+    """
+    ranges = chunk_ranges(log, jobs)
+    logging.info(f"Parsing {log} in {len(ranges)} chunks")
+
+    columns = LogColumns()
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        chunks = executor.map(read_chunk, [log] * len(ranges), *zip(*ranges)) if ranges else []
+
+        for chunk in chunks:
+            columns.extend(chunk, max_lines)
+
+    return columns
+
+
+def column_rows(columns: LogColumns, start: int = 0, stop: int | None = None):
+    """Yields the rows of the columns as tuples of strings."""
+    string = columns.strings.strings.__getitem__
+
+    return zip(
+        map(string, columns.time[start:stop]),
+        map(columns.optypes.strings.__getitem__, columns.optype[start:stop]),
+        map(string, columns.id[start:stop]),
+        map(string, columns.node[start:stop]),
+        map(string, columns.key[start:stop]),
+        map(string, columns.value[start:stop]),
+    )
+
+
+def build_operations(
+    columns: LogColumns,
+    starting_line,
+    line_count,
+    operations: OrderedDict[str, Operation] | None = None,
+    op_counts: dict[str, int] | None = None,
+) -> tuple[int | None, set[str], set[str], set[str], set[int], OrderedDict[str, Operation]]:
+    """
+    Builds the same result as Analyzer.read_log from the parsed columns.
+
+    The operations and op_counts of lines preceding the columns can be given
+    to continue building from them.
+    """
+    operations = OrderedDict() if operations is None else operations
+    op_counts = dict() if op_counts is None else op_counts
+
+    strings = columns.strings.strings
+    string = strings.__getitem__
+    optypes = columns.optypes.strings
+
+    line_total = int(min(len(columns), starting_line + line_count))
+
+    timestamps = TimestampTable()
+
+    initial_row = max(starting_line, 1) - 1
+    initial_time = timestamps[strings[columns.time[initial_row]]] if initial_row < line_total else None
+
+    time_column = columns.time[:line_total]
+    optype_column = columns.optype[:line_total]
+    node_column = columns.node[:line_total]
+    key_column = columns.key[:line_total]
+    value_column = columns.value[:line_total]
+
+    # Nodes, keys and values only depend on the optype of each row
+    start_ids = {i for (i, optype) in enumerate(optypes) if optype in OPERATION_BUILDERS}
+    key_ids = {i for (i, optype) in enumerate(optypes) if optype in KEY_OPTYPES}
+    store_ids = {columns.optypes.get("Store")}
+    reply_ids = {i for (i, optype) in enumerate(optypes) if optype is not None and "Reply" in optype}
+    lookup_reply_ids = {i for i in reply_ids if optypes[i].replace("Reply", "") == "Lookup"}
+    find_reply_ids = {i for i in reply_ids if optypes[i].replace("Reply", "") == "FindNode"}
+
+    node_ids = {node for (optype, node) in zip(optype_column, node_column) if optype in start_ids or optype in reply_ids}
+    node_ids |= {result for (optype, result) in zip(optype_column, key_column) if optype in find_reply_ids}
+    node_ids.discard(MISSING)
+
+    key_ids = {key for (optype, key) in zip(optype_column, key_column) if optype in key_ids}
+    value_ids = {value for (optype, value) in zip(optype_column, value_column) if optype in store_ids}
+    value_ids |= {result for (optype, result) in zip(optype_column, key_column) if optype in lookup_reply_ids}
+    value_ids.discard(MISSING)
+
+    nodes = set(map(string, node_ids))
+    keys = set(map(string, key_ids))
+    values = {NO_VALUE} | set(map(string, value_ids))
+
+    times = set(map(timestamps.__getitem__, map(string, set(time_column))))
+
+    rows = column_rows(columns, 0, line_total)
+
+    # Operations are never cyclic garbage, do not trigger collections while allocating them
+    gc_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        build_rows(rows, operations, op_counts, timestamps)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    logging.info(f"lines read: {line_total}")
+    logging.info(f"operations types: {op_counts}")
+
+    return initial_time, nodes, keys, values, times, operations
+
+
+def build_rows(rows, operations: OrderedDict[str, Operation], op_counts: dict[str, int], timestamps: TimestampTable):
+    builders = OPERATION_BUILDERS
+
+    for (row, (time, optype, id, node, key, value)) in enumerate(rows, 1):
+        time = timestamps[time]
+
+        builder = builders.get(optype)
+
+        if builder is not None:
+            tag = op_counts[optype] = op_counts.get(optype, 0) + 1
+            operations[id] = builder(time, optype, id, tag, node, key, value)
+
+        elif "Reply" in optype:
+            # The key column holds the first result of the reply
+            replier = node
+
+            assert (
+                replier is not None or optype.replace("Reply", "") in ("Join", "Fail", "Leave")
+            ), f"Missing replier of functional operation at line {row}"
+
+            reply = Reply(time, optype, id, UNUSED_TAG, replier)
+            op = operations.get(id)
+
+            if op is not None:
+                reply.tag = op.tag
+                op.set_end_time(time)
+
+                operations["Reply-" + id] = reply
+
+                if isinstance(op, FunctionalOperation):
+                    op.set_replier(replier)
+
+                    if key is not None:
+                        if isinstance(op, Lookup):
+                            op.set_value(key)
+                        elif isinstance(op, FindNode):
+                            op.set_responsible(key)
+
+                    elif isinstance(op, FindNode):
+                        logging.warning(
+                            f"Reply for operation {id} missing result.\n Reply at line {row}"
+                        )
+
+                op_counts[optype] = op_counts.get(optype, 0) + 1
+
+            else:
+                logging.warning(f"Reply for operation {id} received before operation started.\nline: {row} {time}, {optype}, {id}")
+
+        elif optype in IGNORED_OPTYPES:
+            pass
+        else:
+            logging.warning(f"Unknown operation type at line {row}: {time}, {optype}")
+
+
+# Dispatch table of the operations started by each optype
+OPERATION_BUILDERS = {
+    "Store": lambda time, optype, id, tag, node, key, value: Store(time, optype, id, tag, node, key, value),
+    "Remove": lambda time, optype, id, tag, node, key, value: Store(time, optype, id, tag, node, key, NO_VALUE),
+    "Lookup": lambda time, optype, id, tag, node, key, value: Lookup(time, optype, id, tag, node, key),
+    "FindNode": lambda time, optype, id, tag, node, key, value: FindNode(time, optype, id, tag, node, key),
+    "Join": lambda time, optype, id, tag, node, key, value: Join(time, optype, id, tag, node),
+    "Leave": lambda time, optype, id, tag, node, key, value: Leave(time, optype, id, tag, node),
+    "Fail": lambda time, optype, id, tag, node, key, value: Fail(time, optype, id, tag, node),
+}
+
+KEY_OPTYPES = ("Store", "Remove", "Lookup", "FindNode")
@@ -1,3 +1,5 @@
+from collections.abc import MutableSet
+
 module = "Operations"
 
 NO_VALUE = "NO_VALUE"
@@ -5,9 +7,13 @@ NO_RESPONSIBLE = "NO_RESPONSIBLE"
 NO_REPLIER = "NO_REPLIER"
 NO_NODE = "NO_NODE"
 
+UNUSED_TAG = -1
+
 
 class Interval:
-    def __init__(self, start_time: str, id : str):
+    __slots__ = ("start_time", "id", "end_time", "node")
+
+    def __init__(self, start_time: int, id : str):
         self.start_time = start_time
         self.id = id
         self.end_time = None
@@ -16,10 +22,10 @@ class Interval:
     def get_time(self):
         return self.start_time
 
-    def set_time(self, time: str):
+    def set_time(self, time: int):
         self.start_time = time
 
-    def set_end_time(self, end_time: str):
+    def set_end_time(self, end_time: int):
         self.end_time = end_time
     
     def get_end_time(self):
@@ -43,13 +49,17 @@ class Interval:
         return str(self)
 
 class ReadOnly(Interval):
-    def __init__(self, time: str, id : str):
+    __slots__ = ()
+
+    def __init__(self, time: int, id : str):
         super().__init__(time, id)
     def get_name(self):
         return f"ReadOnly${self.id}"
 
 class ReadOnlyEnd(Interval):
-    def __init__(self, time: str, id : str):
+    __slots__ = ()
+
+    def __init__(self, time: int, id : str):
         super().__init__(time, id)
 
     def get_name(self):
@@ -59,14 +69,18 @@ class ReadOnlyEnd(Interval):
         return True
 
 class Stable(Interval):
-    def __init__(self, time: str, id : str):
+    __slots__ = ()
+
+    def __init__(self, time: int, id : str):
         super().__init__(time, id)
 
     def get_name(self):
         return f"Stable${self.id}"
 
 class StableEnd(Interval):
-    def __init__(self, time: str, id : str):
+    __slots__ = ()
+
+    def __init__(self, time: int, id : str):
         super().__init__(time, id)
 
     def get_name(self):
@@ -77,7 +91,9 @@ class StableEnd(Interval):
 
 
 class MemberStart(Interval):
-    def __init__(self, node : str, time: str, id : str):
+    __slots__ = ()
+
+    def __init__(self, node : str, time: int, id : str):
         super().__init__(time, id)
         self.node = node
 
@@ -88,7 +104,9 @@ class MemberStart(Interval):
         return self.node
 
 class MemberEnd(Interval):
-    def __init__(self, node : str, time: str, id : str):
+    __slots__ = ()
+
+    def __init__(self, node : str, time: int, id : str):
         super().__init__(time, id)
         self.node = node
 
@@ -102,13 +120,17 @@ class MemberEnd(Interval):
         return self.node
 
 class IdealStart(Interval):
-    def __init__(self, time: str, id : str):
+    __slots__ = ()
+
+    def __init__(self, time: int, id : str):
         super().__init__(time, id)
     def get_name(self):
         return f"Ideal${self.id}"
 
 class IdealEnd(Interval):
-    def __init__(self, time: str, id : str):
+    __slots__ = ()
+
+    def __init__(self, time: int, id : str):
         super().__init__(time, id)
     def get_name(self):
         return f"Ideal${self.id}"
@@ -117,7 +139,9 @@ class IdealEnd(Interval):
 
 
 class ResponsibleStart(Interval):
-    def __init__(self, node : str, keys : set[str], time: str, id : str):
+    __slots__ = ("keys",)
+
+    def __init__(self, node : str, keys : set[str], time: int, id : str):
         super().__init__(time, id)
         self.node = node
         self.keys = keys
@@ -126,6 +150,10 @@ class ResponsibleStart(Interval):
         return self.keys
 
     def add_key(self, key):
+        # The keys may be a read only view, e.g. a KeyArc of ChordIdeal, copied on the first change
+        if not isinstance(self.keys, MutableSet):
+            self.keys = set(self.keys)
+
         self.keys.add(key)
 
     def get_name(self):
@@ -138,7 +166,9 @@ class ResponsibleStart(Interval):
         return f"{super().__str__()} Node: {self.node} keys ({len(self.keys)}): {self.keys}"
 
 class ResponsibleEnd(Interval):
-    def __init__(self, node : str, keys : set[str], time: str, id : str):
+    __slots__ = ("keys",)
+
+    def __init__(self, node : str, keys : set[str], time: int, id : str):
         super().__init__(time, id)
         self.node = node
         self.keys = keys
@@ -159,9 +189,11 @@ class ResponsibleEnd(Interval):
     #     return f"END {super().__str__()} Node: {self.node} key: {self}"
 
 class Operation:
+    __slots__ = ("time", "optype", "id", "node", "end_time", "tag")
+
     def __init__(
         self,
-        time: str,
+        time: int,
         optype: str,
         id: str,
         tag: int,
@@ -185,7 +217,7 @@ class Operation:
     def get_time(self):
         return self.time
 
-    def set_time(self, time: str):
+    def set_time(self, time: int):
         self.time = time
 
     def get_id(self):
@@ -195,7 +227,7 @@ class Operation:
         assert self.node is not None
         return self.node
 
-    def set_end_time(self, end_time: str):
+    def set_end_time(self, end_time: int):
         self.end_time = end_time
 
     def get_end_time(self):
@@ -212,9 +244,11 @@ class Operation:
 
 
 class Reply(Operation):
+    __slots__ = ()
+
     def __init__(
         self,
-        time: str,
+        time: int,
         optype: str,
         id: str,
         tag: int,
@@ -232,9 +266,11 @@ class Reply(Operation):
 
 
 class FunctionalOperation(Operation):
+    __slots__ = ("key", "replier")
+
     def __init__(
         self,
-        time: str,
+        time: int,
         optype: str,
         id: str,
         tag: int,
@@ -263,9 +299,11 @@ class FunctionalOperation(Operation):
 
 
 class Store(FunctionalOperation):
+    __slots__ = ("value",)
+
     def __init__(
         self,
-        time: str,
+        time: int,
         optype: str,
         id: str,
         tag: int,
@@ -291,9 +329,11 @@ class Store(FunctionalOperation):
 
 
 class Lookup(FunctionalOperation):
+    __slots__ = ("value",)
+
     def __init__(
         self,
-        time: str,
+        time: int,
         optype: str,
         id: str,
         tag: int,
@@ -319,9 +359,11 @@ class Lookup(FunctionalOperation):
 
 
 class FindNode(FunctionalOperation):
+    __slots__ = ("responsible",)
+
     def __init__(
         self,
-        time: str,
+        time: int,
         optype: str,
         id: str,
         tag: int,
@@ -348,9 +390,11 @@ class FindNode(FunctionalOperation):
 
 
 class Join(Operation):
+    __slots__ = ()
+
     def __init__(
         self,
-        time: str,
+        time: int,
         optype: str,
         id: str,
         tag: int,
@@ -361,9 +405,11 @@ class Join(Operation):
 
 
 class Leave(Operation):
+    __slots__ = ()
+
     def __init__(
         self,
-        time: str,
+        time: int,
         optype: str,
         id: str,
         tag: int,
@@ -374,9 +420,11 @@ class Leave(Operation):
 
 
 class Fail(Operation):
+    __slots__ = ()
+
     def __init__(
         self,
-        time: str,
+        time: int,
         optype: str,
         id: str,
         tag: int,
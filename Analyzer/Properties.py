@@ -0,0 +1,648 @@
+import bisect
+import collections
+import copy
+import heapq
+import itertools
+import logging
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+from Operations import (
+    NO_NODE,
+    NO_VALUE,
+)
+from Relations import (
+    FOREVER,
+    Span,
+    Stabbing,
+    enclosing,
+    group,
+    inside,
+    precedes,
+    trace_spans,
+    within,
+)
+
+
+class Trace:
+    """The intervals and operations of a trace, by signature, with the times of its states."""
+
+    def __init__(self, nodes: set[str], operations: dict, stable_regimens: dict, readonly_regimens: dict, members: dict, ideal_states: dict, responsibility_intervals: dict):
+        events = operations | stable_regimens | readonly_regimens | members | ideal_states | responsibility_intervals
+        (self.times, self.spans) = trace_spans(events)
+
+        # Node atoms of the trace
+        self.nodes = nodes | {NO_NODE}
+
+        self.stores : list[Span] = []
+        self.lookups : list[Span] = []
+        self.finds : list[Span] = []
+        self.joins : list[Span] = []
+        self.leaves : list[Span] = []
+        self.fails : list[Span] = []
+
+        for op in operations.values():
+            if op.is_end():
+                continue
+
+            optype = op.get_type()
+            if optype in ("Store", "Remove"):
+                self.stores.append(self.spans[op])
+            elif optype == "Lookup":
+                self.lookups.append(self.spans[op])
+            elif optype == "FindNode":
+                self.finds.append(self.spans[op])
+            elif optype == "Join":
+                self.joins.append(self.spans[op])
+            elif optype == "Leave":
+                self.leaves.append(self.spans[op])
+            elif optype == "Fail":
+                self.fails.append(self.spans[op])
+
+        self.stable = self.interval_spans(stable_regimens)
+        self.readonly = self.interval_spans(readonly_regimens)
+        self.members = self.interval_spans(members)
+        self.ideal = self.interval_spans(ideal_states)
+        self.responsible = self.interval_spans(responsibility_intervals)
+
+        self.functional = self.stores + self.lookups + self.finds
+        self.exits = self.leaves + self.fails
+
+    def interval_spans(self, intervals: dict) -> list[Span]:
+        return [self.spans[interval] for interval in intervals.values() if not interval.is_end()]
+
+    def initial(self, span: Span) -> bool:
+        return self.times[0] in span.starts
+
+
+class Verdict:
+    """
+    Result of a property: whether its precondition holds, as Evaluator.java
+    reports "No scenario" otherwise, and the names of the intervals of each
+    counterexample.
+    """
+
+    def __init__(self, scenario: bool, counterexamples: list[tuple[str, ...]]):
+        self.scenario = scenario
+        self.counterexamples = counterexamples
+
+    def holds(self) -> bool:
+        return not self.counterexamples
+
+    def __str__(self):
+        if not self.scenario:
+            return "No scenario"
+        return "true" if self.holds() else "false"
+
+
+###  Properties of Models/DHTsATL.als
+
+def earliest_stores(stores: Iterable[Span]) -> dict[tuple[str, str], int]:
+    """Start of the first store of each key and value."""
+    earliest = {}
+    for store in stores:
+        pair = (store.event.get_key(), store.event.get_value())
+        if store.start < earliest.get(pair, FOREVER):
+            earliest[pair] = store.start
+
+    return earliest
+
+
+def lookup_consistency(trace: Trace) -> Verdict:
+    # A finite lookup does not precede a store, which only starts once, iff the store starts by its end
+    earliest = earliest_stores(trace.stores)
+
+    scenario = False
+    counterexamples = []
+
+    for lookup in trace.lookups:
+        op = lookup.event
+        if op.get_value() == NO_VALUE or lookup.end is None:
+            continue
+
+        scenario = True
+        if earliest.get((op.get_key(), op.get_value()), FOREVER) > lookup.end:
+            counterexamples.append((lookup.name,))
+
+    return Verdict(scenario, counterexamples)
+
+
+def value_consistency(trace: Trace) -> Verdict:
+    readonly = Stabbing(trace.readonly)
+    ideal = Stabbing(trace.ideal)
+
+    # Finite lookups of each key in each readonly regimen and ideal state
+    reads : dict[tuple, list[Span]] = {}
+
+    for lookup in trace.lookups:
+        if lookup.end is None:
+            continue
+
+        for regimen in enclosing(readonly, lookup):
+            for state in enclosing(ideal, lookup):
+                reads.setdefault((lookup.event.get_key(), regimen, state), []).append(lookup)
+
+    return Verdict(
+        any(len(lookups) > 1 for lookups in reads.values()),
+        [pair for lookups in reads.values() for pair in disagreements(lookups, lambda lookup: lookup.event.get_value())]
+    )
+
+
+def disagreements(spans: list[Span], result: Callable) -> list[tuple[str, str]]:
+    """Pairs of the first span with each result and the first span with another result."""
+    firsts = {}
+    for span in spans:
+        firsts.setdefault(result(span), span)
+
+    (first, *others) = firsts.values()
+    return [(first.name, other.name) for other in others]
+
+
+class FreshStores:
+    """
+    Sweep over the finite stores in the order they end, keeping for each key
+    the stores that precede the current time and do not precede another one
+    that does.
+
+    Stores only start once, so a store precedes a lookup iff it ends before
+    the lookup starts, and precedes another store iff it ends before the
+    other one starts. A finished store is thus fresh iff it ends no earlier
+    than the latest start of the finished stores of its key, and as stores
+    finish in the order they end the fresh ones only leave from the front.
+    """
+
+    def __init__(self, stores: Iterable[Span]):
+        self.stores = sorted((store for store in stores if store.end is not None), key=lambda store: store.end)
+        self.position = 0
+
+        # Latest start of the finished stores of each key
+        self.latest_starts : dict[str, int] = {}
+        # Fresh stores of each key, in the order they end
+        self.fresh : dict[str, collections.deque[Span]] = {}
+        # Fresh stores of each key and value
+        self.fresh_values : collections.Counter[tuple[str, str]] = collections.Counter()
+        # Finished stores of each key and value
+        self.finished : collections.Counter[tuple[str, str]] = collections.Counter()
+
+    def advance(self, time: int):
+        """Finishes the stores that end before time."""
+        while self.position < len(self.stores) and self.stores[self.position].end < time:
+            store = self.stores[self.position]
+            self.position += 1
+
+            key = store.event.get_key()
+            self.finished[(key, store.event.get_value())] += 1
+
+            latest_start = max(self.latest_starts.get(key, store.start), store.start)
+            self.latest_starts[key] = latest_start
+
+            fresh = self.fresh.setdefault(key, collections.deque())
+            fresh.append(store)
+            self.fresh_values[(key, store.event.get_value())] += 1
+
+            while fresh[0].end < latest_start:
+                stale = fresh.popleft()
+                self.fresh_values[(key, stale.event.get_value())] -= 1
+
+
+def fresh_reads(trace: Trace, lookups: list[Span], concurrent: bool) -> Verdict:
+    """
+    Whether each lookup reads the value of a fresh store of its key when it
+    starts, or, if concurrent, of a store of its key it intersects.
+    """
+    sweep = FreshStores(trace.stores)
+
+    # Starts of the stores of each key and value
+    starts = {pair: sorted(store.start for store in stores) for (pair, stores) in group(trace.stores, lambda store: (store.event.get_key(), store.event.get_value())).items()}
+
+    stale = set()
+    for lookup in sorted(lookups, key=lambda lookup: lookup.start):
+        sweep.advance(lookup.start)
+        pair = (lookup.event.get_key(), lookup.event.get_value())
+
+        if sweep.fresh_values[pair] > 0:
+            continue
+
+        # A store intersects a finite lookup iff it starts by the lookup's end and has not finished when it starts
+        if concurrent and bisect.bisect_right(starts.get(pair, ()), lookup.end) > sweep.finished[pair]:
+            continue
+
+        stale.add(lookup)
+
+    return Verdict(bool(lookups), [(lookup.name,) for lookup in lookups if lookup in stale])
+
+
+def value_freshness(trace: Trace) -> Verdict:
+    ideal = Stabbing(trace.ideal)
+
+    lookups = [
+        lookup for lookup in trace.lookups
+        if lookup.event.get_value() != NO_VALUE and lookup.end is not None and enclosing(ideal, lookup)
+    ]
+
+    return fresh_reads(trace, lookups, concurrent=True)
+
+
+def weak_value_freshness(trace: Trace) -> Verdict:
+    ideal = Stabbing(trace.ideal)
+    readonly = Stabbing(trace.readonly)
+
+    lookups = [
+        lookup for lookup in trace.lookups
+        if lookup.event.get_value() != NO_VALUE and lookup.end is not None and enclosing(ideal, lookup) and enclosing(readonly, lookup)
+    ]
+
+    return fresh_reads(trace, lookups, concurrent=False)
+
+
+class Window:
+    """States an ideal state and a stable regimen are both ongoing in."""
+    __slots__ = ("state", "regimen", "start", "stop")
+
+    def __init__(self, state: Span, regimen: Span):
+        self.state = state
+        self.regimen = regimen
+        self.start = max(state.start, regimen.start)
+        self.stop = min(state.stop, regimen.stop)
+
+
+def key_consistency(trace: Trace) -> Verdict:
+    stable = Stabbing(trace.stable)
+
+    # A findNode in an ideal state and a stable regimen starts in a state both are ongoing in
+    windows = Stabbing(Window(state, regimen) for state in trace.ideal for regimen in stable.overlapping(state))
+
+    # Finite findNodes of each key in each window
+    finds : dict[tuple, list[Span]] = {}
+
+    for find in trace.finds:
+        if find.end is None:
+            continue
+
+        for window in windows.stab(find.start):
+            if within(find, window.state) and within(find, window.regimen):
+                finds.setdefault((find.event.get_key(), window), []).append(find)
+
+    return Verdict(
+        any(len(group) > 1 for group in finds.values()),
+        [pair for group in finds.values() for pair in disagreements(group, lambda find: find.event.get_responsible())]
+    )
+
+
+class Responsibilities:
+    """
+    Responsibility intervals of each node and key, indexed on the first
+    operation asking for the pair, as the key sets of the intervals may be
+    arcs of every key rather than sets.
+    """
+
+    def __init__(self, responsible: list[Span]):
+        self.by_node = group(responsible, lambda r: r.event.get_node())
+        self.index : dict[tuple[str, str], Stabbing] = {}
+
+    def responsible(self, node: str, key: str, op: Span) -> bool:
+        """
+        Whether the node is responsible for the key in an interval intersecting
+        the finite operation, which only starts once, so those are the
+        intervals ongoing in a state from its start to its end.
+        """
+        pair = (node, key)
+        if pair not in self.index:
+            self.index[pair] = Stabbing(r for r in self.by_node.get(node, ()) if key in r.event.get_keys())
+
+        return self.index[pair].ongoing_between(op.start, op.end)
+
+
+def findnode_lookup_consistency(trace: Trace) -> Verdict:
+    responsibilities = Responsibilities(trace.responsible)
+
+    scenario = False
+    counterexamples = []
+
+    results = [(find, find.event.get_responsible()) for find in trace.finds] + [(lookup, lookup.event.get_replier()) for lookup in trace.lookups]
+
+    for (op, node) in results:
+        if op.end is None:
+            continue
+
+        scenario = True
+        if not responsibilities.responsible(node, op.event.get_key(), op):
+            counterexamples.append((op.name,))
+
+    return Verdict(scenario, counterexamples)
+
+
+def responsibility_expiration(trace: Trace) -> Verdict:
+    # A fail precedes a join, which only starts once, iff the join starts after it
+    latest_joins = {}
+    for join in trace.joins:
+        node = join.event.get_node()
+        latest_joins[node] = max(latest_joins.get(node, -FOREVER), join.start)
+
+    unending = group((r for r in trace.responsible if r.end is None), lambda r: r.event.get_node())
+
+    scenario = False
+    counterexamples = []
+
+    for fail in trace.fails:
+        node = fail.event.get_node()
+        if fail.end is not None and latest_joins.get(node, -FOREVER) > fail.end:
+            continue
+
+        scenario = True
+        if node in unending:
+            counterexamples.append((fail.name, *(r.name for r in unending[node])))
+
+    return Verdict(scenario, counterexamples)
+
+
+def responsibility_transfer(trace: Trace) -> Verdict:
+    leave_nodes = {leave.event.get_node() for leave in trace.leaves}
+    joins = group(trace.joins, lambda join: join.event.get_node())
+
+    # Finite leaves by end, as a leave precedes a find iff it ends before the find starts
+    leaves = sorted(((leave.end, position, leave) for (position, leave) in enumerate(trace.leaves) if leave.end is not None), key=lambda entry: entry[0])
+    leave_ends = [end for (end, _, _) in leaves]
+
+    scenario = False
+    found = []
+
+    for (position, find) in enumerate(trace.finds):
+        node = find.event.get_responsible()
+        if node not in leave_nodes:
+            continue
+
+        preceding = bisect.bisect_left(leave_ends, find.start)
+        if not preceding:
+            continue
+
+        scenario = True
+        rejoin = next((join for join in joins.get(node, ()) if precedes(find, join)), None)
+        if rejoin is not None:
+            found.extend(((leave_position, position), (leave.name, find.name, rejoin.name)) for (_, leave_position, leave) in leaves[:preceding])
+
+    # In the order of the leaves and then the finds, as Evaluator.java enumerates them
+    found.sort(key=lambda entry: entry[0])
+
+    return Verdict(scenario, [counterexample for (_, counterexample) in found])
+
+
+class Memberships:
+    """
+    Joins and exits of each node sorted by start, telling whether a node is a
+    member when a finite operation happens.
+    """
+
+    def __init__(self, trace: Trace):
+        self.initial = {member.event.get_node() for member in trace.members if trace.initial(member)}
+
+        # Latest end of the joins of each node up to each position, FOREVER for a join that never ends
+        self.join_starts : dict[str, list[int]] = {}
+        self.join_ends : dict[str, list[int]] = {}
+        for (node, joins) in group(trace.joins, lambda join: join.event.get_node()).items():
+            joins.sort(key=lambda join: join.start)
+            self.join_starts[node] = [join.start for join in joins]
+            self.join_ends[node] = list(itertools.accumulate((FOREVER if join.end is None else join.end for join in joins), max))
+
+        # Earliest end of the exits of each node from each position, FOREVER for an exit that never ends
+        self.exit_starts : dict[str, list[int]] = {}
+        self.exit_ends : dict[str, list[int]] = {}
+        for (node, exits) in group(trace.exits, lambda exit: exit.event.get_node()).items():
+            exits.sort(key=lambda exit: exit.start)
+            self.exit_starts[node] = [exit.start for exit in exits]
+            self.exit_ends[node] = list(itertools.accumulate((FOREVER if exit.end is None else exit.end for exit in reversed(exits)), min))[::-1]
+
+    def exits_between(self, node: str, time: int, op: Span) -> bool:
+        """Whether the node exits after the time and before the operation starts."""
+        starts = self.exit_starts.get(node, [])
+        position = bisect.bisect_right(starts, time)
+        return position < len(starts) and self.exit_ends[node][position] < op.start
+
+    def member(self, node: str, op: Span) -> bool:
+        """
+        Whether the node is an initial member that did not exit before the
+        operation, or joined before or during it and did not exit between the
+        join and the operation.
+
+        As the operations only start once, a join precedes or intersects the
+        operation iff it starts by its end, and the join ending last among
+        those has the fewest exits before the operation.
+        """
+        if node in self.initial and not self.exits_between(node, -FOREVER, op):
+            return True
+
+        position = bisect.bisect_right(self.join_starts.get(node, []), op.end) - 1
+        return position >= 0 and not self.exits_between(node, self.join_ends[node][position], op)
+
+
+def membership_guarantee(trace: Trace, operations: list[Span], node_of: Callable) -> Verdict:
+    """
+    Whether the node each finite operation names was an initial member that
+    did not exit before it, or joined before or during it and did not exit
+    between the join and the operation.
+    """
+    memberships = Memberships(trace)
+
+    scenario = False
+    counterexamples = []
+
+    for op in operations:
+        if op.end is None:
+            continue
+
+        scenario = True
+        if not memberships.member(node_of(op.event), op):
+            counterexamples.append((op.name,))
+
+    return Verdict(scenario, counterexamples)
+
+
+def membership_guarantee_responsible(trace: Trace) -> Verdict:
+    return membership_guarantee(trace, trace.finds, lambda find: find.get_responsible())
+
+
+def membership_guarantee_replier(trace: Trace) -> Verdict:
+    return membership_guarantee(trace, trace.functional, lambda op: op.get_replier())
+
+
+def reachability(trace: Trace) -> Verdict:
+    ideal = Stabbing(trace.ideal)
+    members = Stabbing(trace.members)
+
+    # Ideal states each node is a member in
+    member_states : dict[str, set[Span]] = {}
+    for state in trace.ideal:
+        for member in enclosing(members, state):
+            member_states.setdefault(member.event.get_node(), set()).add(state)
+
+    scenario = False
+    counterexamples = []
+
+    for find in trace.finds:
+        node = find.event.get_key()
+        if find.end is None or node not in trace.nodes or node not in member_states:
+            continue
+
+        if member_states[node].isdisjoint(enclosing(ideal, find)):
+            continue
+
+        scenario = True
+        if find.event.get_responsible() != node:
+            counterexamples.append((find.name,))
+
+    return Verdict(scenario, counterexamples)
+
+
+def termination_completeness(trace: Trace) -> Verdict:
+    unending = [regimen for regimen in trace.stable if regimen.end is None]
+
+    scenario = False
+    counterexamples = []
+
+    for op in trace.functional:
+        for regimen in unending:
+            if not inside(op, regimen):
+                continue
+
+            scenario = True
+            if op.end is None:
+                counterexamples.append((op.name, regimen.name))
+
+    return Verdict(scenario, counterexamples)
+
+
+# Properties Evaluator.java checks, in its order, with the trace flags each needs
+PROPERTIES : dict[str, tuple[set[str], Callable[[Trace], Verdict]]] = {
+    "LookupConsistency": ({"lookup", "store"}, lookup_consistency),
+    "ValueConsistency": ({"lookup", "store", "read_only", "ideal"}, value_consistency),
+    "WeakValueFreshness": ({"lookup", "store", "read_only", "ideal"}, weak_value_freshness),
+    "ValueFreshness": ({"lookup", "store", "ideal"}, value_freshness),
+    "KeyConsistency": ({"find", "ideal", "stable"}, key_consistency),
+    "FindNodeLookupConsistency": ({"find", "lookup", "responsible"}, findnode_lookup_consistency),
+    "ResponsibilityExpiration": ({"find", "membership", "responsible"}, responsibility_expiration),
+    "ResponsibilityTransfer": ({"find", "membership", "responsible"}, responsibility_transfer),
+    "MembershipGuarantee_Responsible": ({"find", "membership", "responsible"}, membership_guarantee_responsible),
+    "MembershipGuarantee_Replier": ({"find", "store", "lookup", "membership", "responsible"}, membership_guarantee_replier),
+    "Reachability": ({"find", "ideal", "membership"}, reachability),
+    "TerminationCompleteness": ({"find", "store", "lookup", "stable"}, termination_completeness),
+}
+
+
+def select_properties(flags: set[str]) -> list[str]:
+    """Properties whose intervals are all in a trace with the given flags."""
+    return [name for (name, (required, _)) in PROPERTIES.items() if required <= flags]
+
+
+def evaluate(trace: Trace, names: Iterable[str]) -> Iterator[tuple[str, Verdict, float]]:
+    for name in names:
+        start = time.perf_counter()
+        verdict = PROPERTIES[name][1](trace)
+        yield (name, verdict, time.perf_counter() - start)
+
+
+# Properties that only relate the stores, lookups and findNodes of a key, besides the
+# intervals every key shares, with the operations their counterexamples start with in order
+KEY_LOCAL : dict[str, Callable[[Trace], list[Span]]] = {
+    "LookupConsistency": lambda trace: trace.lookups,
+    "ValueConsistency": lambda trace: trace.lookups,
+    "WeakValueFreshness": lambda trace: trace.lookups,
+    "ValueFreshness": lambda trace: trace.lookups,
+    "KeyConsistency": lambda trace: trace.finds,
+    "FindNodeLookupConsistency": lambda trace: trace.finds + trace.lookups,
+}
+
+# Shards of keys for each worker process, so a few large keys do not leave the others idle
+SHARDS_PER_JOB = 4
+
+
+def shard_keys(trace: Trace, count: int) -> list[set[str]]:
+    """Keys of the trace split in up to count sets with about as many operations each."""
+    sizes = collections.Counter(op.event.get_key() for op in trace.functional)
+
+    # Largest keys first, each to the shard with the fewest operations so far
+    shards = [(0, position, set()) for position in range(max(1, min(count, len(sizes))))]
+    for (key, size) in sizes.most_common():
+        (load, position, keys) = heapq.heappop(shards)
+        keys.add(key)
+        heapq.heappush(shards, (load + size, position, keys))
+
+    return [keys for (_, _, keys) in sorted(shards, key=lambda shard: shard[1])]
+
+
+def shard(trace: Trace, keys: set[str]) -> Trace:
+    """The trace with the stores, lookups and findNodes of the keys only."""
+    sharded = copy.copy(trace)
+    sharded.spans = {}
+
+    sharded.stores = [store for store in trace.stores if store.event.get_key() in keys]
+    sharded.lookups = [lookup for lookup in trace.lookups if lookup.event.get_key() in keys]
+    sharded.finds = [find for find in trace.finds if find.event.get_key() in keys]
+    sharded.functional = sharded.stores + sharded.lookups + sharded.finds
+
+    return sharded
+
+
+# Trace of the worker processes evaluating shards, set when they start
+worker_trace : Trace | None = None
+
+
+def start_worker(trace: Trace):
+    global worker_trace
+    worker_trace = trace
+
+
+def evaluate_shard(keys: set[str], names: list[str]) -> list[tuple[Verdict, float]]:
+    assert worker_trace is not None, "Shard evaluated outside of a worker process"
+    return [(verdict, seconds) for (_, verdict, seconds) in evaluate(shard(worker_trace, keys), names)]
+
+
+def evaluate_sharded(trace: Trace, names: Iterable[str], jobs: int) -> Iterator[tuple[str, Verdict, float]]:
+    """
+    Evaluates the key local properties in worker processes, on shards of the
+    trace with the operations of disjoint sets of keys, and the others in this
+    process meanwhile.
+
+    The verdicts of the shards are merged into the verdict of the trace, with
+    the counterexamples in the order evaluate gives them, and the time of
+    each property summed over the shards.
+    """
+    names = list(names)
+    local = [name for name in names if name in KEY_LOCAL]
+    shards = shard_keys(trace, jobs * SHARDS_PER_JOB) if local else []
+
+    logging.info(f"Evaluating {len(local)} properties on {len(shards)} shards of keys in {jobs} processes")
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=start_worker, initargs=(trace,)) as executor:
+        futures = [executor.submit(evaluate_shard, keys, local) for keys in shards]
+
+        results = {name: (verdict, seconds) for (name, verdict, seconds) in evaluate(trace, (name for name in names if name not in KEY_LOCAL))}
+        shard_results = [future.result() for future in futures]
+
+    for (position, name) in enumerate(local):
+        verdicts = [shard_result[position] for shard_result in shard_results]
+
+        # Counterexamples of different shards start with operations of different keys
+        order = {op.name: index for (index, op) in enumerate(KEY_LOCAL[name](trace))}
+        counterexamples = sorted(
+            (counterexample for (verdict, _) in verdicts for counterexample in verdict.counterexamples),
+            key=lambda counterexample: order[counterexample[0]]
+        )
+
+        results[name] = (Verdict(any(verdict.scenario for (verdict, _) in verdicts), counterexamples), sum(seconds for (_, seconds) in verdicts))
+
+    for name in names:
+        yield (name, *results[name])
+
+
+def report(results: Iterable[tuple[str, Verdict, float]], max_counterexamples: int):
+    """Prints each verdict as Evaluator.java does, followed by its first counterexamples."""
+    for (name, verdict, seconds) in results:
+        print(f"{name}: {verdict} {seconds:.3f}s")
+
+        for counterexample in verdict.counterexamples[:max_counterexamples]:
+            print(f"    {', '.join(counterexample)}")
+
+        if len(verdict.counterexamples) > max_counterexamples:
+            print(f"    ... {len(verdict.counterexamples) - max_counterexamples} more counterexamples")
@@ -0,0 +1,215 @@
+from typing import Callable, Iterator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from Relations import (
+    FOREVER,
+    Index,
+    Span,
+    after,
+    before,
+    contains,
+    during,
+    during_inverse,
+    equal,
+    finishes,
+    finishes_inverse,
+    group,
+    inside,
+    intersects,
+    meets,
+    meets_inverse,
+    overlap,
+    overlap_inverse,
+    precedes,
+    requires,
+    starts,
+    starts_inverse,
+    within,
+)
+
+
+# Cells of the relation masks computed at once, so the mask and the int64
+# temporaries of a block stay in the cache
+BLOCK_CELLS = 1 << 16
+
+# Column value of the ends and stops that never happen
+NEVER = (1 << 63) - 1
+
+
+class Columns:
+    """
+    Starts, stops, ends and times of the states after the ends of operations,
+    as int64 arrays, with NEVER for the ones that do not happen.
+    """
+    __slots__ = ("start", "stop", "end", "after_end", "finite")
+
+    def __init__(self, start, stop, end, after_end, finite):
+        self.start = start
+        self.stop = stop
+        self.end = end
+        self.after_end = after_end
+        self.finite = finite
+
+    @classmethod
+    def of(cls, spans: list[Span]) -> "Columns":
+        # Intervals closed by an end object also start at its time, which the columns cannot hold
+        assert all(len(span.starts) == 1 for span in spans), "Relation masks of spans with several starts"
+
+        def column(values) -> "numpy.ndarray":
+            return numpy.fromiter((NEVER if value is None or value == FOREVER else value for value in values), dtype=numpy.int64, count=len(spans))
+
+        return cls(
+            column(span.start for span in spans),
+            column(span.stop for span in spans),
+            column(span.end for span in spans),
+            column(span.after_end for span in spans),
+            numpy.fromiter((span.end is not None for span in spans), dtype=bool, count=len(spans)),
+        )
+
+    def __len__(self):
+        return len(self.start)
+
+    def rows(self, first: int, last: int) -> "Columns":
+        """The operations from first to last as a column, broadcasting against a row of others."""
+        return Columns(*(getattr(self, name)[first:last, None] for name in self.__slots__))
+
+    def slice(self, first: int, last: int) -> "Columns":
+        return Columns(*(getattr(self, name)[first:last] for name in self.__slots__))
+
+
+###  Allen relations of Relations.py over operations, which only start once
+
+def contained_mask(a: Columns, b: Columns):
+    return (b.start <= a.start) & (a.stop <= b.stop)
+
+def equal_mask(a: Columns, b: Columns):
+    return (a.start == b.start) & (a.stop == b.stop)
+
+def before_mask(a: Columns, b: Columns):
+    return a.finite & (b.start > a.end) & (a.after_end != b.start)
+
+def meets_mask(a: Columns, b: Columns):
+    return a.finite & (a.after_end == b.start)
+
+def precedes_mask(a: Columns, b: Columns):
+    return a.finite & (b.start > a.end)
+
+def overlap_mask(a: Columns, b: Columns):
+    return a.finite & (a.start < b.start) & (b.start <= a.end) & (a.end <= b.stop) & (b.end != a.end)
+
+def during_mask(a: Columns, b: Columns):
+    return a.finite & (b.end != a.end) & contained_mask(a, b) & (a.start != b.start)
+
+def starts_mask(a: Columns, b: Columns):
+    return (a.start == b.start) & ~contained_mask(b, a)
+
+def finishes_mask(a: Columns, b: Columns):
+    return (a.end == b.end) & ~contained_mask(b, a)
+
+def inside_mask(a: Columns, b: Columns):
+    return during_mask(a, b) | starts_mask(a, b) | finishes_mask(a, b)
+
+def intersects_mask(a: Columns, b: Columns):
+    """
+    Equal, In either way or Overlap either way. Spans that start or end
+    together are Equal, Starts or Finishes one way, and a finite span
+    contained in another without either is During it.
+    """
+    return (
+        (a.start == b.start) | (a.end == b.end) |
+        (a.finite & contained_mask(a, b)) | (b.finite & contained_mask(b, a)) |
+        overlap_mask(a, b) | overlap_mask(b, a)
+    )
+
+
+# Mask of each relation between a column of operations and a row of others
+MASKS : dict[Callable[[Span, Span], bool], Callable[[Columns, Columns], "numpy.ndarray"]] = {
+    equal: equal_mask,
+    before: before_mask,
+    meets: meets_mask,
+    precedes: precedes_mask,
+    overlap: overlap_mask,
+    during: during_mask,
+    starts: starts_mask,
+    finishes: finishes_mask,
+    inside: inside_mask,
+    within: lambda a, b: equal_mask(a, b) | inside_mask(a, b),
+    intersects: intersects_mask,
+    after: lambda a, b: before_mask(b, a),
+    meets_inverse: lambda a, b: meets_mask(b, a),
+    overlap_inverse: lambda a, b: overlap_mask(b, a),
+    during_inverse: lambda a, b: during_mask(b, a),
+    starts_inverse: lambda a, b: starts_mask(b, a),
+    finishes_inverse: lambda a, b: finishes_mask(b, a),
+    contains: lambda a, b: inside_mask(b, a),
+    requires: lambda a, b: equal_mask(a, b) | inside_mask(a, b) | overlap_mask(b, a) | starts_mask(b, a),
+}
+
+
+def blocks(relation: Callable[[Span, Span], bool], left: Columns, right: Columns) -> Iterator[tuple[int, int, "numpy.ndarray"]]:
+    """
+    Masks of the relation between blocks of left and right of at most
+    BLOCK_CELLS cells, with the first operation of left and of right of each.
+    """
+    width = min(len(right), BLOCK_CELLS)
+    rows = max(1, BLOCK_CELLS // max(1, width))
+
+    for first_column in range(0, len(right), width):
+        columns = right.slice(first_column, first_column + width)
+        for first_row in range(0, len(left), rows):
+            yield (first_row, first_column, MASKS[relation](left.rows(first_row, first_row + rows), columns))
+
+
+def operation_key(span: Span) -> str:
+    return span.event.get_key()
+
+
+def pairs(relation: Callable[[Span, Span], bool], left: list[Span], right: list[Span], key: Callable = operation_key) -> Iterator[tuple[Span, Span]]:
+    """
+    Every pair of an operation of left and one of right of the same key with
+    the relation, key by key. Without numpy, an Index of the operations of
+    right of each key finds them.
+    """
+    rights = group(right, key)
+
+    for (k, lefts) in group(left, key).items():
+        if k not in rights:
+            continue
+
+        if numpy is None:
+            index = Index(rights[k])
+            for span in lefts:
+                for other in index.related(relation, span):
+                    yield (span, other)
+            continue
+
+        for (first_row, first_column, mask) in blocks(relation, Columns.of(lefts), Columns.of(rights[k])):
+            for (row, column) in zip(*numpy.nonzero(mask)):
+                yield (lefts[first_row + row], rights[k][first_column + column])
+
+
+def related_any(relation: Callable[[Span, Span], bool], left: list[Span], right: list[Span], key: Callable = operation_key) -> list[bool]:
+    """Whether each operation of left has the relation with some operation of right of its key."""
+    rights = group(right, key)
+    related = {}
+
+    for (k, lefts) in group(left, key).items():
+        if k not in rights:
+            continue
+
+        if numpy is None:
+            index = Index(rights[k])
+            related.update((span, bool(index.related(relation, span))) for span in lefts)
+            continue
+
+        found = numpy.zeros(len(lefts), dtype=bool)
+        for (first_row, _, mask) in blocks(relation, Columns.of(lefts), Columns.of(rights[k])):
+            found[first_row:first_row + len(mask)] |= mask.any(axis=1)
+
+        related.update(zip(lefts, found.tolist()))
+
+    return [related.get(span, False) for span in left]
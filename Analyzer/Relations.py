@@ -0,0 +1,370 @@
+import bisect
+import itertools
+import math
+
+from typing import Callable, Iterable, Iterator
+
+from Operations import (
+    Interval,
+    Operation,
+)
+
+
+# Stop of the intervals that are ongoing until the end of the trace
+FOREVER = math.inf
+
+
+class Span:
+    """
+    An interval or operation as the Alloy trace written by complete_trace sees it.
+
+    start is the time of the state the interval starts in and stop the time of
+    the last state it is ongoing in, FOREVER if it is never terminated. end is
+    the time of its end boundary, None if it is not finite. Intervals closed by
+    an end object also start at the time of the end object, since
+    create_instance adds a start tuple for both, so starts holds every time
+    Starting[i] holds.
+    """
+    __slots__ = ("event", "name", "start", "stop", "end", "after_end", "starts")
+
+    def __init__(self, event: Interval | Operation):
+        self.event = event
+        self.name = event.get_name()
+        self.start = event.get_time()
+        self.stop = FOREVER
+        self.end = None
+        # Time of the state after the end boundary
+        self.after_end = FOREVER
+        self.starts = {self.start}
+
+    def __repr__(self):
+        return f"{self.name} [{self.start}, {self.stop}]"
+
+
+def trace_spans(events: dict) -> tuple[list[int], dict[Interval | Operation, Span]]:
+    """
+    Times of the states of the trace of the intervals, operations and their
+    ends, and the span of each interval and operation in it.
+    """
+    times = sorted({event.get_time() for event in events.values()})
+    following = dict(zip(times, times[1:]))
+
+    spans : dict[Interval | Operation, Span] = {}
+    for event in events.values():
+        if not event.is_end():
+            spans[event] = Span(event)
+
+    for event in events.values():
+        if event.is_end():
+            span = spans[events[event.get_id()]]
+            span.stop = event.get_time()
+
+            if isinstance(event, Interval):
+                span.starts.add(event.get_time())
+
+    for span in spans.values():
+        end_time = span.event.get_end_time()
+        if end_time is not None and (end_time in following or end_time == times[-1]):
+            span.end = end_time
+            span.after_end = following.get(end_time, FOREVER)
+
+    return (times, spans)
+
+
+class Stabbing:
+    """Spans, or anything else with a start and a stop, sorted by start, finding the ones ongoing at a time."""
+
+    def __init__(self, spans: Iterable[Span]):
+        self.spans = sorted(spans, key=lambda span: span.start)
+        self.starts = [span.start for span in self.spans]
+
+        # Latest stop of the spans up to each position
+        self.max_stops = []
+        max_stop = -FOREVER
+        for span in self.spans:
+            max_stop = max(max_stop, span.stop)
+            self.max_stops.append(max_stop)
+
+    def stab(self, time: int) -> Iterator[Span]:
+        position = bisect.bisect_right(self.starts, time) - 1
+        while position >= 0 and self.max_stops[position] >= time:
+            span = self.spans[position]
+            if span.stop >= time:
+                yield span
+            position -= 1
+
+    def ongoing_between(self, start: int, stop: int) -> bool:
+        """Whether some span is ongoing in a state from start to stop."""
+        position = bisect.bisect_right(self.starts, stop) - 1
+        return position >= 0 and self.max_stops[position] >= start
+
+    def overlapping(self, span: Span) -> Iterator[Span]:
+        """Spans ongoing in some state the span is ongoing in."""
+        yield from self.stab(span.start)
+
+        position = bisect.bisect_right(self.starts, span.start)
+        while position < len(self.spans) and self.starts[position] <= span.stop:
+            yield self.spans[position]
+            position += 1
+
+
+class IntervalTree:
+    """
+    Centered interval tree of spans, finding the ones ongoing at a time in
+    logarithmic time plus the time to list them, however long the spans are.
+    """
+    __slots__ = ("center", "by_start", "by_stop", "left", "right")
+
+    def __init__(self, spans: list[Span]):
+        """Tree of the spans, which are sorted by start."""
+        assert spans, "Empty interval tree"
+        self.center = spans[len(spans) // 2].start
+
+        # Spans ongoing at the center, by start and by stop from the latest
+        self.by_start = []
+        before = []
+        after = []
+        for span in spans:
+            if span.stop < self.center:
+                before.append(span)
+            elif span.start > self.center:
+                after.append(span)
+            else:
+                self.by_start.append(span)
+
+        self.by_stop = sorted(self.by_start, key=lambda span: span.stop, reverse=True)
+        self.left = IntervalTree(before) if before else None
+        self.right = IntervalTree(after) if after else None
+
+    def stab(self, time: int) -> Iterator[Span]:
+        tree = self
+        while tree is not None:
+            if time < tree.center:
+                yield from itertools.takewhile(lambda span: span.start <= time, tree.by_start)
+                tree = tree.left
+            elif time > tree.center:
+                yield from itertools.takewhile(lambda span: span.stop >= time, tree.by_stop)
+                tree = tree.right
+            else:
+                yield from tree.by_start
+                return
+
+
+def group(spans: Iterable[Span], key: Callable) -> dict:
+    groups = {}
+    for span in spans:
+        groups.setdefault(key(span), []).append(span)
+    return groups
+
+
+###  Allen relations of Models/ATL.als over the states of the trace
+
+def contained(i1: Span, i2: Span) -> bool:
+    """Every state i1 is ongoing in, i2 is ongoing in."""
+    return i2.start <= i1.start and i1.stop <= i2.stop
+
+def equal(i1: Span, i2: Span) -> bool:
+    return i1.start == i2.start and i1.stop == i2.stop
+
+def before(i1: Span, i2: Span) -> bool:
+    return i1.end is not None and i2.start > i1.end and i1.after_end not in i2.starts
+
+def meets(i1: Span, i2: Span) -> bool:
+    return i1.end is not None and i1.after_end in i2.starts
+
+def precedes(i1: Span, i2: Span) -> bool:
+    """Before or Meets."""
+    return i1.end is not None and (i2.start > i1.end or i1.after_end in i2.starts)
+
+def overlap(i1: Span, i2: Span) -> bool:
+    return i1.end is not None and i1.start < i2.start <= i1.end <= i2.stop and i2.end != i1.end
+
+def during(i1: Span, i2: Span) -> bool:
+    return i1.end is not None and i2.end != i1.end and contained(i1, i2) and i1.starts.isdisjoint(i2.starts)
+
+def starts(i1: Span, i2: Span) -> bool:
+    return not i1.starts.isdisjoint(i2.starts) and not contained(i2, i1)
+
+def finishes(i1: Span, i2: Span) -> bool:
+    return i1.end == i2.end and not contained(i2, i1)
+
+def inside(i1: Span, i2: Span) -> bool:
+    """In."""
+    return during(i1, i2) or starts(i1, i2) or finishes(i1, i2)
+
+def within(i1: Span, i2: Span) -> bool:
+    """In or Equal, as the properties contain operations in regimens and states."""
+    return equal(i1, i2) or inside(i1, i2)
+
+def intersects(i1: Span, i2: Span) -> bool:
+    return equal(i1, i2) or inside(i1, i2) or inside(i2, i1) or overlap(i1, i2) or overlap(i2, i1)
+
+def after(i1: Span, i2: Span) -> bool:
+    return before(i2, i1)
+
+def meets_inverse(i1: Span, i2: Span) -> bool:
+    return meets(i2, i1)
+
+def overlap_inverse(i1: Span, i2: Span) -> bool:
+    return overlap(i2, i1)
+
+def during_inverse(i1: Span, i2: Span) -> bool:
+    return during(i2, i1)
+
+def starts_inverse(i1: Span, i2: Span) -> bool:
+    return starts(i2, i1)
+
+def finishes_inverse(i1: Span, i2: Span) -> bool:
+    return finishes(i2, i1)
+
+def contains(i1: Span, i2: Span) -> bool:
+    return inside(i2, i1)
+
+def requires(i1: Span, i2: Span) -> bool:
+    """i1 starts while i2 is ongoing."""
+    return equal(i1, i2) or inside(i1, i2) or overlap(i2, i1) or starts(i2, i1)
+
+
+# Relations of Models/ATL.als, by the name of their predicate
+RELATIONS : dict[str, Callable[[Span, Span], bool]] = {
+    "Equal": equal,
+    "Before": before,
+    "Meets": meets,
+    "Overlap": overlap,
+    "During": during,
+    "Starts": starts,
+    "Finishes": finishes,
+    "After": after,
+    "DuringI": during_inverse,
+    "OverlapI": overlap_inverse,
+    "MeetsI": meets_inverse,
+    "StartsI": starts_inverse,
+    "FinishesI": finishes_inverse,
+    "In": inside,
+    "Contains": contains,
+    "Precedes": precedes,
+    "Intersects": intersects,
+    "Requires": requires,
+}
+
+
+def enclosing(stabbing: Stabbing, span: Span) -> list[Span]:
+    """
+    Spans of stabbing the span is In or Equal to. Those are ongoing at one of
+    the starts of the span, as the spans of the trace other than fails stop
+    at their end.
+    """
+    found = {}
+    for time in span.starts:
+        for other in stabbing.stab(time):
+            if other not in found and within(span, other):
+                found[other] = None
+
+    return list(found)
+
+
+class Index:
+    """
+    Spans indexed by start, end and the states they are ongoing in, finding
+    the spans a relation of Models/ATL.als relates a span to. Each relation
+    reads its candidates off the sorted starts or ends, the interval tree or
+    the spans starting or ending at a time, and only checks those, so the
+    time is proportional to the spans found plus the candidates the relation
+    rejects. Any other relation checks every span.
+    """
+
+    def __init__(self, spans: Iterable[Span]):
+        self.spans = sorted(spans, key=lambda span: span.start)
+        self.starts = [span.start for span in self.spans]
+        self.tree = IntervalTree(self.spans) if self.spans else None
+
+        # Finite spans by end, which also sorts them by the time of the state after it
+        self.finite = sorted((span for span in self.spans if span.end is not None), key=lambda span: span.end)
+        self.ends = [span.end for span in self.finite]
+        self.after_ends = [span.after_end for span in self.finite]
+        self.unending = [span for span in self.spans if span.end is None]
+
+        # Spans also starting at the time of their end object, by that time
+        self.restarting = {}
+        for span in self.spans:
+            for time in span.starts:
+                if time != span.start:
+                    self.restarting.setdefault(time, []).append(span)
+
+    def ongoing_at(self, time: int) -> Iterator[Span]:
+        return self.tree.stab(time) if self.tree is not None else iter(())
+
+    def starting_at(self, time: int) -> list[Span]:
+        """Spans with a start at the time."""
+        return self.spans[bisect.bisect_left(self.starts, time):bisect.bisect_right(self.starts, time)] + self.restarting.get(time, [])
+
+    def starting_after(self, time: int, until: int = FOREVER) -> list[Span]:
+        """Spans starting after the time and by until."""
+        return self.spans[bisect.bisect_right(self.starts, time):bisect.bisect_right(self.starts, until)]
+
+    def starting_within(self, span: Span) -> list[Span]:
+        """Spans starting in a state the span is ongoing in."""
+        return self.spans[bisect.bisect_left(self.starts, span.start):bisect.bisect_right(self.starts, span.stop)]
+
+    def ending_at(self, end: int | None) -> list[Span]:
+        """Spans with the end, the ones that are not finite if it is None."""
+        if end is None:
+            return self.unending
+        return self.finite[bisect.bisect_left(self.ends, end):bisect.bisect_right(self.ends, end)]
+
+    def ending_before(self, time: int) -> list[Span]:
+        return self.finite[:bisect.bisect_left(self.ends, time)]
+
+    def meeting(self, time: int) -> list[Span]:
+        """Spans ending in the state before the time."""
+        return self.finite[bisect.bisect_left(self.after_ends, time):bisect.bisect_right(self.after_ends, time)]
+
+    def overlapping(self, span: Span) -> Iterator[Span]:
+        """Spans ongoing in some state the span is ongoing in."""
+        return itertools.chain(self.ongoing_at(span.start), self.starting_after(span.start, span.stop))
+
+    def starting_with(self, span: Span) -> Iterator[Span]:
+        """Spans with a start in common with the span."""
+        return itertools.chain.from_iterable(self.starting_at(time) for time in span.starts)
+
+    def related(self, relation: Callable[[Span, Span], bool], span: Span) -> list[Span]:
+        """Spans other with relation(span, other), in the order the index finds them."""
+        candidates = CANDIDATES.get(relation, lambda index, span: index.spans)(self, span)
+
+        found = {}
+        for other in candidates:
+            if other not in found and relation(span, other):
+                found[other] = None
+
+        return list(found)
+
+
+# Spans of the index each relation may relate a span to, a superset of the related ones
+CANDIDATES : dict[Callable[[Span, Span], bool], Callable[[Index, Span], Iterable[Span]]] = {
+    equal: lambda index, span: index.starting_at(span.start),
+    before: lambda index, span: index.starting_after(span.end) if span.end is not None else (),
+    meets: lambda index, span: index.starting_at(span.after_end),
+    overlap: lambda index, span: index.starting_after(span.start, span.end) if span.end is not None else (),
+    during: lambda index, span: index.ongoing_at(span.start),
+    starts: lambda index, span: index.starting_with(span),
+    finishes: lambda index, span: index.ending_at(span.end),
+    after: lambda index, span: index.ending_before(span.start),
+    meets_inverse: lambda index, span: itertools.chain.from_iterable(index.meeting(time) for time in span.starts),
+    overlap_inverse: lambda index, span: index.ongoing_at(span.start),
+    during_inverse: lambda index, span: index.starting_within(span),
+    starts_inverse: lambda index, span: index.starting_with(span),
+    finishes_inverse: lambda index, span: index.ending_at(span.end),
+    precedes: lambda index, span: itertools.chain(CANDIDATES[before](index, span), CANDIDATES[meets](index, span)),
+    inside: lambda index, span: itertools.chain(index.ongoing_at(span.start), index.starting_with(span), index.ending_at(span.end)),
+    within: lambda index, span: CANDIDATES[inside](index, span),
+    contains: lambda index, span: itertools.chain(index.starting_within(span), index.starting_with(span), index.ending_at(span.end)),
+    intersects: lambda index, span: index.overlapping(span),
+    requires: lambda index, span: index.overlapping(span),
+}
+
+
+def pairs(relation: Callable[[Span, Span], bool], spans: Iterable[Span], index: Index) -> Iterator[tuple[Span, Span]]:
+    """Every pair of a span and a span of the index with the relation."""
+    for span in spans:
+        for other in index.related(relation, span):
+            yield (span, other)
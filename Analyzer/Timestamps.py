@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+from typing import Iterable
+
+
+# Time of the intervals carried over from before the analyzed window, earlier than any log timestamp
+INITIAL_TIME = 0
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def parse_timestamp(time: str) -> int:
+    """Converts a log timestamp, e.g. 2024-11-12 19:56:48.781, to microseconds since the epoch."""
+    return (datetime.fromisoformat(time) - EPOCH) // MICROSECOND
+
+
+def format_timestamp(time: int) -> str:
+    """Converts microseconds since the epoch back to a log timestamp."""
+    if time == INITIAL_TIME:
+        return str(INITIAL_TIME)
+
+    timestamp = (EPOCH + time * MICROSECOND).isoformat(sep=" ", timespec="microseconds")
+
+    # Logs record milliseconds
+    if timestamp.endswith("000"):
+        timestamp = timestamp[:-3]
+
+    return timestamp
+
+
+class TimestampTable(dict):
+    """Converts log timestamps, sharing a single int for each repeated timestamp."""
+
+    def __missing__(self, time: str) -> int:
+        timestamp = self[time] = parse_timestamp(time)
+        return timestamp
+
+
+def boundary_names(times: Iterable[int]) -> dict[int, str]:
+    """Names the Boundary atom of each time after its position in the trace."""
+    return {time: f"Boundary${position}" for (position, time) in enumerate(sorted(times))}
@@ -0,0 +1,90 @@
+import xml.etree.ElementTree as ET
+
+from copy import copy, deepcopy
+from typing import BinaryIO, Iterable
+
+
+MARKER = "TraceWriterMarker"
+
+
+class InstanceTemplate:
+    """
+    Instance template serialized once to bytes.
+
+    Only the Happens and Ongoing sigs change between the states of a trace,
+    so each state is produced by splicing their atoms into the serialized
+    static portion of the template. The Ongoing atoms are given already
+    serialized, so callers can reuse them across states.
+    """
+
+    def __init__(self, instance: ET.Element):
+        template = deepcopy(instance)
+
+        happens_sig = template.find("sig[@label='ATL/Happens']")
+        ongoing_sig = template.find("sig[@label='ATL/Ongoing']")
+
+        assert happens_sig is not None, "Happens sig not found"
+        assert ongoing_sig is not None, "Ongoing sig not found"
+
+        ET.SubElement(happens_sig, MARKER)
+        ET.SubElement(ongoing_sig, MARKER)
+
+        marker = f"<{MARKER} />".encode("utf-8")
+        parts = ET.tostring(template, encoding="utf-8").split(marker)
+
+        assert len(parts) == 3, "Happens and Ongoing sigs not found in template"
+
+        self.prefix, self.middle, self.suffix = parts
+        self.atoms : dict[str, bytes] = {}
+
+    def atom(self, label: str) -> bytes:
+        atom = self.atoms.get(label)
+        if atom is None:
+            atom = ET.tostring(ET.Element("atom", label=label), encoding="utf-8")
+            self.atoms[label] = atom
+
+        return atom
+
+    def instance(self, happens: Iterable[str], *ongoing: bytes) -> tuple[bytes, ...]:
+        """
+        Parts of the serialized instance. They are written one after the other
+        rather than joined, as joining copies the static portions of the
+        template, which grow with the log, for every state.
+        """
+        return (
+            self.prefix,
+            *map(self.atom, happens),
+            self.middle,
+            *ongoing,
+            self.suffix,
+        )
+
+
+class TraceWriter:
+    """
+    Writes the trace root to the output one instance at a time.
+
+    Instances appended to the writer are written immediately, so they can be
+    discarded by the caller. The resulting bytes are the same as writing the
+    complete tree with ElementTree.write.
+    """
+
+    def __init__(self, output: BinaryIO, root: ET.Element):
+        self.output = output
+
+        # Serialize the root with a marker child to obtain its opening and closing tags
+        shell = copy(root)
+        shell.append(ET.Element(MARKER))
+        head, tail = ET.tostring(shell, encoding="utf-8").split(f"<{MARKER} />".encode("utf-8"))
+
+        self.tail = tail
+        self.instances = 0
+
+        self.output.write(head)
+
+    def append(self, instance: Iterable[bytes]):
+        self.output.writelines(instance)
+        self.instances += 1
+
+    def close(self):
+        self.output.write(self.tail)
@@ -0,0 +1,110 @@
+"""
+Time of the chord ideal parser over a synthetic ideal log with many churn
+events, to check that updating the responsibilities costs the same per event
+however long the interval history grows.
+
+NODES nodes join, then each churn event points a random node to a random
+successor. Every line of the ideal log comes with a Lookup at its time, and
+the parser is fed the operations and membership intervals as the analyzer
+does. The results are appended to bench_output.txt at the root of the
+repository.
+
+    python bench/ideal_churn.py [churn events ...]
+"""
+import random
+import sys
+import tempfile
+import time
+
+from collections import OrderedDict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "Analyzer"))
+
+from ChordIdeal import ChordIdealParser
+from IdealParsers import event_stream, parse_ideal
+from Operations import Lookup, MemberStart, Reply
+from Timestamps import format_timestamp, parse_timestamp
+
+
+CHURN_EVENTS = (5000, 10000, 20000, 40000)
+
+NODES = 2000
+KEYS = 500
+
+START_TIME = parse_timestamp("2024-11-12 19:00:00.000")
+
+# Microseconds between the lines of the ideal log
+STEP = 1000
+
+OUTPUT = ROOT / "bench_output.txt"
+
+
+def node_id(rnd: random.Random) -> str:
+    return f"{rnd.getrandbits(32):08X}"
+
+
+def build_log(churn: int, ideal_log: Path, seed: int = 1) -> tuple[set[str], OrderedDict, OrderedDict]:
+    """Writes the ideal log and returns the keys, operations and membership intervals of the run."""
+    rnd = random.Random(seed)
+    nodes = sorted({node_id(rnd) for _ in range(NODES)})
+    keys = {node_id(rnd) for _ in range(KEYS)}
+
+    # Nodes join pointing to the next one, then churn
+    ring = zip(nodes, nodes[1:] + nodes[:1])
+    pointers = [*ring, *((rnd.choice(nodes), rnd.choice(nodes)) for _ in range(churn))]
+
+    operations = OrderedDict()
+    members = OrderedDict()
+
+    with ideal_log.open("w") as f:
+        for (i, (node, successor)) in enumerate(pointers):
+            line_time = START_TIME + (i + 1) * STEP
+            f.write(f"{format_timestamp(line_time)}, Successor, {node}, {successor}\n")
+
+            if i < len(nodes):
+                member = MemberStart(node, line_time - 1, "M" + str(i))
+                members[member.get_id()] = member
+
+            id = str(i)
+            operations[id] = Lookup(line_time, "Lookup", id, i, node, successor)
+            operations["Reply-" + id] = Reply(line_time + 1, "ReplyLookup", id, i, node)
+
+    return (keys, operations, members)
+
+
+def run(churn: int) -> tuple[float, int]:
+    with tempfile.TemporaryDirectory() as directory:
+        ideal_log = Path(directory) / "ideal.txt"
+        (keys, operations, members) = build_log(churn, ideal_log)
+        limit_time = max(op.get_time() for op in operations.values())
+
+        start = time.perf_counter()
+        (_, responsibility) = parse_ideal(ChordIdealParser, ideal_log, limit_time, keys, event_stream(operations, members))
+
+        return (time.perf_counter() - start, len(responsibility))
+
+
+def main():
+    counts = [int(n) for n in sys.argv[1:]] or CHURN_EVENTS
+
+    lines = [f"ideal_churn: {NODES} nodes, {KEYS} keys", f"{'churn':>8} {'intervals':>10} {'seconds':>9} {'us/event':>9}"]
+    per_event = []
+
+    for churn in counts:
+        (seconds, intervals) = run(churn)
+        per_event.append(seconds / (NODES + churn))
+        lines.append(f"{churn:>8} {intervals:>10} {seconds:>9.2f} {per_event[-1] * 1e6:>9.1f}")
+        print(lines[-1] if len(lines) > 3 else "\n".join(lines), flush=True)
+
+    # Closing an interval in constant time keeps the time per event flat as the history grows
+    lines.append(f"time per event, largest over smallest run: {per_event[-1] / per_event[0]:.2f}")
+    print(lines[-1])
+
+    with OUTPUT.open("a") as f:
+        f.write("\n".join(lines) + "\n\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Time of complete_trace against the number of events, with a fixed number of
+them ongoing at once, to check that it scales linearly in the event count.
+
+Each run builds N Lookups, each replied CONCURRENCY states after its start,
+for 2N events, and writes their trace to the null device. Every state of the
+trace repeats the static part of the instance, which grows with the log, so
+the bytes written grow quadratically, but building the trace should not. The
+results are appended to bench_output.txt at the root of the repository.
+
+    python bench/ongoing_scaling.py [N ...]
+"""
+import os
+import sys
+import time
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "Analyzer"))
+
+import Analyzer
+
+from Operations import Lookup, Reply
+from Timestamps import boundary_names
+from TraceWriter import InstanceTemplate, TraceWriter
+
+
+EVENT_COUNTS = (5000, 10000, 20000, 40000)
+
+# Lookups ongoing at any time, once the first ones are replied
+CONCURRENCY = 2000
+
+OUTPUT = ROOT / "bench_output.txt"
+
+
+def build_operations(n: int) -> dict:
+    operations = {}
+    for i in range(n):
+        operations[str(i)] = Lookup(i + 1, "Lookup", str(i), i, "N", "K")
+        operations["Reply-" + str(i)] = Reply(i + 1 + CONCURRENCY, "ReplyLookup", str(i), i, "N")
+
+    return operations
+
+
+def run(n: int) -> float:
+    operations = build_operations(n)
+    times = {op.get_time() for op in operations.values()}
+    boundaries = boundary_names(times)
+
+    instance = Analyzer.create_instance(str(ROOT / "Models" / "ATL.als"), {"N"}, {"K"}, {"NO_VALUE"}, times, boundaries, operations, {}, {}, {}, {}, {})
+
+    start = time.perf_counter()
+
+    with open(os.devnull, "wb") as output:
+        writer = TraceWriter(output, Analyzer.create_root())
+        Analyzer.complete_trace(writer, InstanceTemplate(instance), boundaries, operations, {}, {}, {}, {}, {})
+        writer.close()
+
+    return time.perf_counter() - start
+
+
+def main():
+    counts = [int(n) for n in sys.argv[1:]] or EVENT_COUNTS
+
+    lines = [f"ongoing_scaling: {CONCURRENCY} ongoing lookups", f"{'events':>8} {'seconds':>9} {'us/event':>9}"]
+    per_event = []
+
+    for n in counts:
+        seconds = run(n)
+        per_event.append(seconds / (2 * n))
+        lines.append(f"{2 * n:>8} {seconds:>9.2f} {per_event[-1] * 1e6:>9.1f}")
+        print(lines[-1] if len(lines) > 3 else "\n".join(lines), flush=True)
+
+    # A linear build keeps the time per event flat as the event count grows
+    lines.append(f"time per event, largest over smallest run: {per_event[-1] / per_event[0]:.2f}")
+    print(lines[-1])
+
+    with OUTPUT.open("a") as f:
+        f.write("\n".join(lines) + "\n\n")
+
+
+if __name__ == "__main__":
+    main()
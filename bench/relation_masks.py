@@ -0,0 +1,112 @@
+"""
+Time of the bulk relation queries of RelationMasks with the numpy masks
+against the Relations.Index fallback used without numpy.
+
+Each run builds N operations on KEYS keys, a store for every LOOKUPS_PER_STORE
+lookups, each replied a random number of steps after its start and some never
+replied, and times two queries over their spans: which stores precede a lookup
+of their key, and which lookups intersect a store of their key. Both backends
+must give the same answers. The results are appended to bench_output.txt at
+the root of the repository.
+
+    python bench/relation_masks.py [N ...]
+"""
+import random
+import sys
+import time
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "Analyzer"))
+
+import RelationMasks
+
+from Operations import Lookup, Reply, Store
+from Relations import intersects, precedes, trace_spans
+
+
+OPERATION_COUNTS = (25000, 50000, 100000)
+
+KEYS = 20
+LOOKUPS_PER_STORE = 3
+
+# Steps from the start of an operation to its reply, and share of operations never replied
+MAX_DURATION = 200
+UNREPLIED = 0.01
+
+OUTPUT = ROOT / "bench_output.txt"
+
+
+def build_spans(n: int, seed: int = 1) -> tuple[list, list]:
+    """Spans of the stores and of the lookups of a synthetic trace of n operations."""
+    rnd = random.Random(seed)
+    keys = [f"{rnd.getrandbits(32):08X}" for _ in range(KEYS)]
+
+    operations = {}
+    for i in range(n):
+        id = str(i)
+        key = rnd.choice(keys)
+
+        if i % (LOOKUPS_PER_STORE + 1) == 0:
+            operations[id] = Store(i, "Store", id, i, "N", key, f"v{i}")
+        else:
+            operations[id] = Lookup(i, "Lookup", id, i, "N", key)
+
+        if rnd.random() >= UNREPLIED:
+            reply_time = i + rnd.randint(1, MAX_DURATION)
+            operations[id].set_end_time(reply_time)
+            operations["Reply-" + id] = Reply(reply_time, "Reply" + operations[id].get_type(), id, i, "N")
+
+    (_, spans) = trace_spans(operations)
+    stores = [span for span in spans.values() if isinstance(span.event, Store)]
+    lookups = [span for span in spans.values() if isinstance(span.event, Lookup)]
+
+    return (stores, lookups)
+
+
+def timed(query: tuple, use_numpy: bool) -> tuple[float, list[bool]]:
+    numpy = RelationMasks.numpy
+    if not use_numpy:
+        RelationMasks.numpy = None
+
+    try:
+        start = time.perf_counter()
+        related = RelationMasks.related_any(*query)
+        return (time.perf_counter() - start, related)
+    finally:
+        RelationMasks.numpy = numpy
+
+
+def main():
+    if RelationMasks.numpy is None:
+        sys.exit("numpy is not installed, there are no masks to time")
+
+    counts = [int(n) for n in sys.argv[1:]] or OPERATION_COUNTS
+
+    lines = [f"relation_masks: {KEYS} keys, a store every {LOOKUPS_PER_STORE} lookups", f"{'operations':>10} {'query':<24} {'related':>8} {'masks':>8} {'index':>8} {'speedup':>8}"]
+    print("\n".join(lines), flush=True)
+
+    for n in counts:
+        (stores, lookups) = build_spans(n)
+
+        queries = {
+            "store precedes lookup": (precedes, stores, lookups),
+            "lookup intersects store": (intersects, lookups, stores),
+        }
+
+        for (name, query) in queries.items():
+            (masks_seconds, masks_related) = timed(query, use_numpy=True)
+            (index_seconds, index_related) = timed(query, use_numpy=False)
+            if masks_related != index_related:
+                sys.exit(f"Masks and index disagree on {name} over {n} operations")
+
+            lines.append(f"{n:>10} {name:<24} {sum(masks_related):>8} {masks_seconds:>7.2f}s {index_seconds:>7.2f}s {index_seconds / masks_seconds:>7.1f}x")
+            print(lines[-1], flush=True)
+
+    with OUTPUT.open("a") as f:
+        f.write("\n".join(lines) + "\n\n")
+
+
+if __name__ == "__main__":
+    main()